@@ -14,8 +14,12 @@ def main():
     logging.basicConfig(level=logging.WARN)
 
     httpport = 8444
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     app = aiohttp.web.Application()
-    upnpserver = upnp.UPNPServer(http=app, httpport=httpport)
+    upnpserver = upnp.UPNPServer(loop=loop, http=app, httpport=httpport)
+    # server given an application leaves ssdp start to its owner
+    app.on_startup.append(lambda app: upnpserver.start())
 
     #upnpserver.ssdp.register({
     #    'usn':'uuid:8d43c269-a700-4541-81b9-1789c6149a1a::upnp:rootdevice',
@@ -27,7 +31,7 @@ def main():
     #    ('192.168.1.145', '5000'), manifestation='local'
     #)
 
-    aiohttp.web.run_app(app, port=httpport, reuse_port=True)
+    aiohttp.web.run_app(app, port=httpport, reuse_port=True, loop=loop)
 
 
 if __name__ == '__main__':
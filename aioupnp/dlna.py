@@ -4,8 +4,12 @@
 #
 
 import logging
+import time
+import bisect
 import urllib.parse
+from xml.sax.saxutils import escape
 import aiohttp
+import aiohttp.client_exceptions
 import lxml.etree as xml
 
 
@@ -54,14 +58,14 @@ class DIDLLite:
         return element
 
     @staticmethod
-    def VideoItem(itemid, parentid, restricted, title, resource):
+    def VideoItem(itemid, parentid, restricted, title, resource, upnpclass='object.item.videoItem'):
         n = lambda n, e: xml.QName(DIDLLite.namespaces[n], e)
 
         item = xml.Element('item', {'id': str(itemid), 'parentID': str(parentid), 'restricted': str(restricted)})
         _title = xml.SubElement(item, n('dc', 'title'))
         _title.text = title
         _class = xml.SubElement(item, n('upnp', 'class'))
-        _class.text = 'object.item.videoItem'
+        _class.text = upnpclass
         _date = xml.SubElement(item, n('dc', 'date'))
         _date.text = '2003-07-23T01:18:00+02:00'
         item.append(resource)
@@ -84,34 +88,87 @@ class DIDLLite:
 didl = DIDLLite()
 
 
+class LatencyHistogram:
+    """action round trip times in seconds"""
+    buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def add(self, latency, error=False):
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        if error:
+            self.errors += 1
+
+    def status(self):
+        return {
+            'buckets': dict(zip([str(i) for i in self.buckets] + ['+Inf'], self.counts)),
+            'count': self.count,
+            'avg': self.total / self.count if self.count else None,
+            'max': self.max,
+            'errors': self.errors,
+        }
+
+
 class DLNAAction:
+    # (serviceType, action) -> (envelope head, envelope tail, headers)
+    templates = {}
+
     def __init__(self, service, action):
         self.service = service
         self.action = action
 
+    @classmethod
+    def template(cls, servicetype, action):
+        key = (servicetype, action)
+        if key not in cls.templates:
+            ns = {'s': 'http://schemas.xmlsoap.org/soap/envelope/'}
+            n = lambda n, e: xml.QName(ns[n], e)
+
+            e = xml.Element(n('s', 'Envelope'), attrib={n('s', 'encodingStyle'): "http://schemas.xmlsoap.org/soap/encoding/"}, nsmap=ns)
+            b = xml.SubElement(e, n('s', 'Body'))
+            a = xml.SubElement(b, xml.QName(servicetype, action), nsmap={'u': servicetype})
+            a.text = '{arguments}'
+
+            head, tail = xml.tostring(e, encoding='utf8', xml_declaration=True, pretty_print=False).decode().split('{arguments}')
+            cls.templates[key] = (head, tail, {
+                'SOAPACTION': '"{}#{}"'.format(servicetype, action),
+                'content-type': 'text/xml; charset="utf-8"'
+            })
+        return cls.templates[key]
+
+    def envelope(self, **data):
+        head, tail, _ = self.template(self.service.get('serviceType'), self.action)
+        return ''.join([head] + ['<{0}>{1}</{0}>'.format(name, escape(str(val)))
+                                 for name, val in data.items()] + [tail])
+
     async def call(self, **data):
         url = urllib.parse.urljoin(self.service.location, self.service.get('controlURL'))
-        servicetype = self.service.get('serviceType')
-
-        ns = {'s': 'http://schemas.xmlsoap.org/soap/envelope/'}
-        n = lambda n, e: xml.QName(ns[n], e)
-
-        e = xml.Element(n('s', 'Envelope'), attrib={n('s', 'encodingStyle'): "http://schemas.xmlsoap.org/soap/encoding/"}, nsmap=ns)
-        b = xml.SubElement(e, n('s', 'Body'))
-        a = xml.SubElement(b, xml.QName(servicetype, self.action), nsmap={'u': servicetype})
-        for name, val in data.items():
-            xml.SubElement(a, name).text = str(val)
-
-        datastr = xml.tostring(e, encoding='utf8', xml_declaration=True, pretty_print=False).decode()
-
-        async with aiohttp.ClientSession(read_timeout=5, raise_for_status=True) as session:
-            async with session.post(url, data=datastr,
-                        headers={
-                            'SOAPACTION':'"{}#{}"'.format(servicetype, self.action),
-                            'content-type': 'text/xml; charset="utf-8"'
-                        }
-                    ) as resp:
-                return resp
+        _, _, headers = self.template(self.service.get('serviceType'), self.action)
+        datastr = self.envelope(**data)
+
+        begin = time.monotonic()
+        error = True
+        try:
+            for retry in (True, False):
+                try:
+                    async with self.service.device.session.post(url, data=datastr, headers=headers) as resp:
+                        await resp.read()
+                        error = False
+                        return resp
+                except aiohttp.client_exceptions.ServerDisconnectedError:
+                    # renderer closed idle keep-alive connection
+                    if not retry:
+                        raise
+        finally:
+            self.service.device.latency(self.action).add(time.monotonic() - begin, error)
 
 
 class DLNAService:
@@ -182,12 +239,23 @@ class AVTransport(DLNAService):
     async def setplaymode(self, mode):
         return await self.action('SetPlayMode').call(InstanceID=0, NewPlayMode=mode)
 
-    async def setavtransporturi(self, url, title, mime):
-        dlnatags = 'http-get:*:{}:DLNA.ORG_OP=01;DLNA.ORG_CI=0;DLNA.ORG_FLAGS=01700000000000000000000000000000'.format(mime)
-        metadata = didl.DIDLElement(didl.VideoItem(None, None, 0, title, didl.Resource(dlnatags, url)))
-        return await self.action('SetAVTransportURI').call(InstanceID=0, CurrentURI=url, CurrentURIMetaData=didl.toString(metadata))
-
-    async def setnextavtransporturi(self, url, title, mime):
-        dlnatags = 'http-get:*:{}:DLNA.ORG_OP=01;DLNA.ORG_CI=0;DLNA.ORG_FLAGS=01700000000000000000000000000000'.format(mime)
-        metadata = didl.DIDLElement(didl.VideoItem(None, None, 0, title, didl.Resource(dlnatags, url)))
-        return await self.action('SetNextAVTransportURI').call(InstanceID=0, NextURI=url, NextURIMetaData=didl.toString(metadata))
+    @staticmethod
+    def metadata(url, title, mime, protocolinfo=None):
+        if protocolinfo is None:
+            flags = '00d00000000000000000000000000000' if mime.startswith('image') else '01700000000000000000000000000000'
+            protocolinfo = 'http-get:*:{}:DLNA.ORG_OP=01;DLNA.ORG_CI=0;DLNA.ORG_FLAGS={}'.format(mime, flags)
+        if mime.startswith('audio'):
+            upnpclass = 'object.item.audioItem.musicTrack'
+        elif mime.startswith('image'):
+            upnpclass = 'object.item.imageItem.photo'
+        else:
+            upnpclass = 'object.item.videoItem'
+        return didl.toString(didl.DIDLElement(didl.VideoItem(None, None, 0, title, didl.Resource(protocolinfo, url), upnpclass)))
+
+    async def setavtransporturi(self, url, title, mime, protocolinfo=None):
+        metadata = self.metadata(url, title, mime, protocolinfo)
+        return await self.action('SetAVTransportURI').call(InstanceID=0, CurrentURI=url, CurrentURIMetaData=metadata)
+
+    async def setnextavtransporturi(self, url, title, mime, protocolinfo=None):
+        metadata = self.metadata(url, title, mime, protocolinfo)
+        return await self.action('SetNextAVTransportURI').call(InstanceID=0, NextURI=url, NextURIMetaData=metadata)
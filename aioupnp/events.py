@@ -91,51 +91,51 @@ class EventsServer:
                 self.log.info('task.cancel done %s', uid)
 
     async def _event_task(self, service, callback):
-        async with aiohttp.ClientSession(read_timeout=5, raise_for_status=True) as session:
-            sid = None
-            try:
-                while True:
-                    try:
-                        self.log.info('event_task %s callback %s', service.friendlyName,
-                                      urllib.parse.urljoin(service.device.localhost, '/events/'))
+        session = service.device.session
+        sid = None
+        try:
+            while True:
+                try:
+                    self.log.info('event_task %s callback %s', service.friendlyName,
+                                  urllib.parse.urljoin(service.device.localhost, '/events/'))
+                    async with session.request('SUBSCRIBE', service.url,
+                                               headers={
+                                                   'TIMEOUT': 'Second-1800',
+                                                   'CALLBACK': '<{}>'.format(
+                                                       urllib.parse.urljoin(service.device.localhost, '/events/')),
+                                                   'NT': 'upnp:event',
+                                                   'Date': time.ctime()
+                                               }) as resp:
+
+                        sid = resp.headers.get('SID')
+                        # TODO: parse Second-1800
+                        timeout = int(''.join(filter(str.isdigit, resp.headers.get('TIMEOUT'))))
+                        self.sidtoservice[sid] = service
+                        notify.connect('UPnP.DLNA.Event.{}'.format(sid), callback)
+                        self.log.warning('subscribe %s event SID:%s', service.friendlyName, sid)
+                    while True:
+                        await asyncio.sleep(timeout / 2)
                         async with session.request('SUBSCRIBE', service.url,
                                                    headers={
-                                                       'TIMEOUT': 'Second-1800',
-                                                       'CALLBACK': '<{}>'.format(
-                                                           urllib.parse.urljoin(service.device.localhost, '/events/')),
-                                                       'NT': 'upnp:event',
-                                                       'Date': time.ctime()
+                                                       'SID': sid,
                                                    }) as resp:
-
-                            sid = resp.headers.get('SID')
-                            # TODO: parse Second-1800
-                            timeout = int(''.join(filter(str.isdigit, resp.headers.get('TIMEOUT'))))
-                            self.sidtoservice[sid] = service
-                            notify.connect('UPnP.DLNA.Event.{}'.format(sid), callback)
-                            self.log.warning('subscribe %s event SID:%s', service.friendlyName, sid)
-                        while True:
-                            await asyncio.sleep(timeout / 2)
-                            async with session.request('SUBSCRIBE', service.url,
-                                                       headers={
-                                                           'SID': sid,
-                                                       }) as resp:
-                                self.log.warning('resubscribe %s event SID:%s', service.friendlyName,
-                                                 resp.headers.get('SID'))
-                    except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError,
-                            aiohttp.client_exceptions.ClientResponseError) as err:
-                        self.log.warning('event_task %s %s', err.__class__.__name__, service.friendlyName)
-                    finally:
-                        notify.disconnect('UPnP.DLNA.Event.{}'.format(sid), callback)
-                        if sid in self.sidtoservice:
-                            service = self.sidtoservice.pop(sid)
-                            if service.uid in self.events:
-                                self.events.pop(service.uid)
-                    await asyncio.sleep(60)
-            finally:
-                if sid:
-                    try:
-                        async with session.request('UNSUBSCRIBE', service.url, headers={'SID': sid}) as resp:
-                            self.log.warning('unsubscribe %s retcode: %s', service.friendlyName, resp.status)
-                    except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError,
-                            aiohttp.client_exceptions.ClientResponseError):
-                        pass
+                            self.log.warning('resubscribe %s event SID:%s', service.friendlyName,
+                                             resp.headers.get('SID'))
+                except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError,
+                        aiohttp.client_exceptions.ClientResponseError) as err:
+                    self.log.warning('event_task %s %s', err.__class__.__name__, service.friendlyName)
+                finally:
+                    notify.disconnect('UPnP.DLNA.Event.{}'.format(sid), callback)
+                    if sid in self.sidtoservice:
+                        service = self.sidtoservice.pop(sid)
+                        if service.uid in self.events:
+                            self.events.pop(service.uid)
+                await asyncio.sleep(60)
+        finally:
+            if sid:
+                try:
+                    async with session.request('UNSUBSCRIBE', service.url, headers={'SID': sid}) as resp:
+                        self.log.warning('unsubscribe %s retcode: %s', service.friendlyName, resp.status)
+                except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError,
+                        aiohttp.client_exceptions.ClientResponseError):
+                    pass
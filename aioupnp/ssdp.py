@@ -4,9 +4,12 @@
 #
 
 import asyncio
+import itertools
 import logging
+import re
 import socket
 import struct
+import time
 import ipaddress
 import urllib.parse
 from . import notify
@@ -14,6 +17,49 @@ from . import version
 
 SSDP_PORT = 1900
 SSDP_ADDR = '239.255.255.250'
+# only these headers are decoded, others are skipped
+SSDP_HEADERS = frozenset((b'nt', b'nts', b'st', b'usn', b'location', b'cache-control', b'server', b'man', b'mx'))
+SIOCGIFFLAGS = 0x8913
+SIOCGIFADDR = 0x8915
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+IFF_MULTICAST = 0x1000
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49)
+SSDP_TYPE = re.compile(rb'^(?:NT|ST)[ \t]*:[ \t]*([^\r\n]*)', re.IGNORECASE | re.MULTILINE)
+
+
+def interfaces(names=None):
+    """IPv4 address of each up, multicast capable interface, empty where not supported"""
+    result = {}
+    try:
+        import fcntl
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for _, name in socket.if_nameindex():
+                if names is not None and name not in names:
+                    continue
+                ifreq = struct.pack('256s', name.encode()[:15])
+                try:
+                    flags, = struct.unpack('16xH', fcntl.ioctl(sock, SIOCGIFFLAGS, ifreq)[:18])
+                    if flags & (IFF_UP | IFF_LOOPBACK | IFF_MULTICAST) != IFF_UP | IFF_MULTICAST:
+                        continue
+                    # no IPv4 address raises
+                    result[name] = socket.inet_ntoa(fcntl.ioctl(sock, SIOCGIFADDR, ifreq)[20:24])
+                except OSError:
+                    pass
+    except (ImportError, AttributeError, OSError):
+        pass
+    return result
+
+
+def parse_headers(data):
+    """decode known headers of SSDP datagram, header names are lowercase"""
+    headers = {}
+    for line in data.splitlines()[1:]:
+        key, sep, value = line.partition(b':')
+        key = key.strip().lower()
+        if sep and key in SSDP_HEADERS:
+            headers[key.decode()] = value.strip().decode('utf-8', 'replace')
+    return headers
 
 
 class SSDPDevice(dict):
@@ -26,6 +72,8 @@ class SSDPDevice(dict):
         self.handle = None
         self.manifestation = None
         self.silent = False
+        # (name, address) of local interface the device was seen on
+        self.interface = None
 
     def shutdown(self):
         if self.handle:
@@ -49,14 +97,13 @@ class SSDPRemoteDevice(SSDPDevice):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.manifestation = 'remote'
+        self.expires = None
         self.ssdpalive()
 
     def ssdpalive(self):
-        if self.handle:
-            self.handle.cancel()
-
+        # removed by SSDPServer._sweep
         _, expiry = self.get('cache-control', 'max-age=60').split('=')
-        self.handle = self.server.loop.call_later(int(expiry) + 5, self.server.unregister, self.get('usn'))
+        self.expires = self.server.loop.time() + int(expiry) + 5
 
 
 class SSDPLocalDevice(SSDPDevice):
@@ -76,10 +123,11 @@ class SSDPLocalDevice(SSDPDevice):
     def send_notify(self) -> None:
         self.log.info('Sending %s notification for %s', self.get('nts'), self.get('usn'))
         self.log.debug('send_notify content %s', self)
-        try:
-            self.server.transport.sendto(bytes(self), (SSDP_ADDR, SSDP_PORT))
-        except (AttributeError, socket.error) as msg:
-            self.log.info("failure sending out alive notification: %r", msg)
+        for name, (_, _, transport) in list(self.server.interfaces.items()):
+            try:
+                transport.sendto(bytes(self), (SSDP_ADDR, SSDP_PORT))
+            except socket.error as msg:
+                self.log.info("failure sending out alive notification on %s: %r", name, msg)
 
     async def _resend_notify(self):
         while True:
@@ -89,35 +137,35 @@ class SSDPLocalDevice(SSDPDevice):
 
 
 class SSDPProtocol(asyncio.DatagramProtocol):
-    def __init__(self, server):
+    def __init__(self, server, interface=None):
         self.log = logging.getLogger('{}.{}'.format(__name__, self.__class__.__name__))
         self.server = server
+        self.interface = interface
 
     def datagram_received(self, data, addr):
-        lines = data.decode().splitlines()
-        cmd = lines.pop(0)
+        allowed = self.server.allowed_types
+        if allowed is not None:
+            match = SSDP_TYPE.search(data)
+            if match is None or not match.group(1).strip().startswith(allowed):
+                self.server.ssdp_stats['dropped'] += 1
+                return
+        self.server.ssdp_stats['accepted'] += 1
 
-        headers = {}
-        for line in lines:
-            try:
-                key, value = line.split(':', 1)
-                headers[key.lower()] = value.strip()
-            except ValueError:
-                pass
+        cmd = data.split(b'\n', 1)[0].decode('utf-8', 'replace').strip()
+        headers = parse_headers(data)
 
         if cmd.startswith('M-SEARCH *'):
             self.server.discoveryRequest(headers, addr)
         elif cmd.startswith('NOTIFY *'):
             self.log.debug('Notification %s from %s for %s', headers.get('nts'), addr, headers.get('nt'))
             if headers.get('nts') == 'ssdp:alive':
-                self.server.register(headers)
+                self.server.register(headers, interface=self.interface)
             elif headers.get('nts') == 'ssdp:byebye':
                 self.server.unregister(headers.get('usn'))
             else:
                 self.log.warning('Unknown subtype %s for notification type %s', headers.get('nts'), headers.get('nt'))
         elif cmd.startswith('HTTP/1.1 200 OK'):
-            headers['nt'] = headers.get('st')
-            self.server.register(headers)
+            self.server.search_response(headers, self.interface)
         else:
             self.log.warning('Unknown SSDP command %s\n%s', cmd, headers)
 
@@ -127,29 +175,114 @@ class SSDPMcastProtocol(SSDPProtocol):
         sock = transport.get_extra_info('socket')
         sockname = transport.get_extra_info('sockname')
         group = socket.inet_aton(sockname[0])
-        mreq = struct.pack('4sL', group, socket.INADDR_ANY)
+        if self.interface is None:
+            mreq = struct.pack('4sL', group, socket.INADDR_ANY)
+        else:
+            # receive only datagrams of this socket's own membership
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+            except OSError:
+                pass
+            mreq = struct.pack('4s4s', group, socket.inet_aton(self.interface[1]))
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
 
 class SSDPServer:
-    def __init__(self, loop=None):
+    def __init__(self, loop=None, allowed_types=None, sweep_interval=5,
+                 search_target='ssdp:all', search_burst=(1, 2, 4, 8), search_interval=120, search_mx=2,
+                 interface_names=None, interface_interval=30):
         self.__log = logging.getLogger('{}.{}'.format(__name__, __class__.__name__))
         self.loop = loop or asyncio.get_event_loop()
+        # NT/ST prefixes of datagrams to handle, None handles all
+        self.allowed_types = tuple(i.encode() for i in allowed_types) if allowed_types is not None else None
+        self.ssdp_stats = {'accepted': 0, 'dropped': 0}
+        self.sweep_interval = sweep_interval
+        self.sweep_stats = {'sweeps': 0, 'expired': 0, 'last': 0.0, 'max': 0.0}
         self.ssdpdevices = {}
         self.resend_notify_loop = None
         self.resend_mseatch_loop = None
+        self.sweep_loop = None
+        self.interface_loop = None
+        # interface names to use, None uses all
+        self.interface_names = interface_names
+        self.interface_interval = interface_interval
+        # name -> (address, multicast transport, unicast transport), name None is INADDR_ANY
+        self.interfaces = {}
+        # MSearch and _watch_interfaces both update interfaces
+        self._interfaces_lock = asyncio.Lock()
+        self.search_target = search_target
+        # delays between searches after start or refresh, then one per search_interval
+        self.search_burst = search_burst
+        self.search_interval = search_interval
+        self.search_mx = search_mx
+        self.search_stats = {'searches': 0, 'responses': 0, 'duplicates': 0}
+        self.discovery = {}
+        self._search_restart = asyncio.Event()
+        self._search_started = None
+        self._search_seen = set()
         self.transport = None
-        self.ucastprotocol = None
 
-        mcast = self.loop.create_datagram_endpoint(
-            lambda: SSDPMcastProtocol(self),
+    async def start(self):
+        """join multicast group on every interface and start periodic discovery"""
+        await self.update_interfaces()
+        self.resend_mseatch_loop = self.loop.create_task(self._resend_msearch())
+        self.sweep_loop = self.loop.create_task(self._sweep())
+        self.interface_loop = self.loop.create_task(self._watch_interfaces())
+
+    async def _open_interface(self, name, address):
+        interface = (name, address) if name is not None else None
+        mtransport, _ = await self.loop.create_datagram_endpoint(
+            lambda: SSDPMcastProtocol(self, interface),
             local_addr=(SSDP_ADDR, SSDP_PORT), family=socket.AF_INET,
             reuse_port=True,
         )
-        self.mtransport, self.mcastprotocol = self.loop.run_until_complete(mcast)
-
-
-        self.resend_mseatch_loop = self.loop.create_task(self._resend_msearch())
+        try:
+            transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: SSDPProtocol(self, interface),
+                local_addr=(address, 0) if address else None,
+                family=socket.AF_INET, proto=socket.IPPROTO_UDP,
+                reuse_port=True,
+            )
+            if address:
+                transport.get_extra_info('socket').setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                                              socket.inet_aton(address))
+        except BaseException:
+            # also on cancellation, multicast socket must not leak
+            mtransport.close()
+            raise
+        self.interfaces[name] = (address, mtransport, transport)
+
+    def _close_interface(self, name):
+        _, mtransport, transport = self.interfaces.pop(name)
+        mtransport.close()
+        transport.close()
+
+    async def update_interfaces(self):
+        """open sockets of new interfaces, close removed ones, True if changed"""
+        async with self._interfaces_lock:
+            current = interfaces(self.interface_names) or {None: None}
+            changed = False
+            for name, (address, mtransport, transport) in list(self.interfaces.items()):
+                if name not in current or current[name] != address or mtransport.is_closing() or transport.is_closing():
+                    self._close_interface(name)
+                    changed = True
+            for name, address in current.items():
+                if name not in self.interfaces:
+                    try:
+                        await self._open_interface(name, address)
+                        changed = True
+                    except OSError as msg:
+                        self.__log.warning('interface %s %s: %r', name, address, msg)
+            if changed:
+                self.__log.info('interfaces %s', {name: address for name, (address, _, _) in self.interfaces.items()})
+            self.transport = next((transport for _, _, transport in self.interfaces.values()), None)
+            return changed
+
+    async def _watch_interfaces(self):
+        while True:
+            await asyncio.sleep(self.interface_interval)
+            if await self.update_interfaces():
+                self.search()
 
     async def device_created(self, device:SSDPDevice):
         pass
@@ -163,24 +296,35 @@ class SSDPServer:
     async def shutdown(self):
         for key in list(self.ssdpdevices):
             self.unregister(key)
-        self.resend_mseatch_loop.cancel()
-        try:
-            await self.resend_mseatch_loop
-        except asyncio.CancelledError:
-            pass
-
-    def register(self, headers, manifestation='remote', silent=False):
+        for task in (self.resend_mseatch_loop, self.sweep_loop, self.interface_loop):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        async with self._interfaces_lock:
+            for name in list(self.interfaces):
+                self._close_interface(name)
+            self.transport = None
+
+    def register(self, headers, manifestation='remote', silent=False, interface=None):
         self.__log.log(1, 'Register headers: %s', headers)
         if headers.get('usn') in self.ssdpdevices:
             self.__log.debug('updating last-seen for %r', headers.get('usn'))
             device = self.ssdpdevices.get(headers.get('usn'))
+            if device.get('location') == headers.get('location'):
+                device.interface = device.interface or interface
+                device.ssdpalive()
+                return
             current_host, current_port = urllib.parse.splitnport(urllib.parse.urlsplit(device.get('location')).netloc)
             headers_host, headers_port = urllib.parse.splitnport(urllib.parse.urlsplit(headers.get('location')).netloc)
             current_host = ipaddress.ip_address(current_host)
             headers_host = ipaddress.ip_address(headers_host)
             if current_port != headers_port or current_host.version == headers_host.version and current_host != headers_host:
                 device.update(headers)
-                if device.get('nt') == 'upnp:rootdevice':
+                device.interface = interface or device.interface
+                if self._described(device):
                     self.loop.create_task(self.device_updated(device))
             device.ssdpalive()
         else:
@@ -194,17 +338,66 @@ class SSDPServer:
                 device.silent = silent
             self.__log.info('device %s', device)
             if device:
+                device.interface = interface
                 self.ssdpdevices[headers.get('usn')] = device
 
-                if headers.get('nt') == 'upnp:rootdevice':
+                if self._described(device):
                     self.loop.create_task(self.device_created(device))
 
+    def _described(self, device):
+        """root devices and answers of targeted search are built, both may share one location"""
+        nt = device.get('nt')
+        return nt == 'upnp:rootdevice' or nt == self.search_target and nt != 'ssdp:all'
+
     def unregister(self, usn):
         if usn in self.ssdpdevices:
             self.__log.info("Un-registering %s", usn)
-            if self.ssdpdevices[usn].get('nt') == 'upnp:rootdevice':
+            if self._described(self.ssdpdevices[usn]):
                 self.loop.create_task(self.device_removed(self.ssdpdevices[usn]))
             self.ssdpdevices.pop(usn).shutdown()
+            self.discovery.pop(usn, None)
+
+    def search_response(self, headers, interface=None):
+        """register M-SEARCH response, repeated answers to one search are dropped"""
+        usn = headers.get('usn')
+        self.search_stats['responses'] += 1
+        if usn in self._search_seen:
+            self.search_stats['duplicates'] += 1
+            return
+        self._search_seen.add(usn)
+        headers['nt'] = headers.get('st')
+        if usn not in self.ssdpdevices and self._search_started is not None:
+            self.discovery[usn] = round(self.loop.time() - self._search_started, 3)
+            self.__log.info('discovered %s in %.3fs on %s', usn, self.discovery[usn], interface)
+        self.register(headers, interface=interface)
+
+    def search(self):
+        """restart search burst"""
+        self._search_restart.set()
+
+    def sweep(self):
+        """unregister remote devices not announced within their max-age"""
+        begin = time.perf_counter()
+        now = self.loop.time()
+        expired = [usn for usn, device in self.ssdpdevices.items()
+                   if device.manifestation == 'remote' and device.expires < now]
+        for usn in expired:
+            self.unregister(usn)
+        cost = time.perf_counter() - begin
+        self.sweep_stats['sweeps'] += 1
+        self.sweep_stats['expired'] += len(expired)
+        self.sweep_stats['last'] = cost
+        self.sweep_stats['max'] = max(self.sweep_stats['max'], cost)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    def status(self):
+        return dict(self.ssdp_stats, devices=len(self.ssdpdevices), sweep=dict(self.sweep_stats),
+                    interfaces={name: address for name, (address, _, _) in self.interfaces.items()},
+                    search=dict(self.search_stats), discovery=dict(self.discovery))
 
     def discoveryRequest(self, headers, addr):
         (host, port) = addr
@@ -214,28 +407,33 @@ class SSDPServer:
         req = ['M-SEARCH * HTTP/1.1',
                'HOST: %s:%d' % (SSDP_ADDR, SSDP_PORT),
                'MAN: "ssdp:discover"',
-               'MX: 5',
-               'ST: ssdp:all',
+               'MX: {}'.format(self.search_mx),
+               'ST: {}'.format(self.search_target),
                'USER-AGENT: {}/{}'.format(__name__, version),
                '', '']
         req = '\r\n'.join(req)
 
         try:
-            if self.transport is None or self.transport.is_closing():
-                self.transport, self.ucastprotocol = await self.loop.create_datagram_endpoint(
-                    lambda: SSDPProtocol(self),
-                    family=socket.AF_INET, proto=socket.IPPROTO_UDP,
-                    reuse_port=True,
-                )
-
-            self.__log.debug('send MSearch to %s:%d', SSDP_ADDR, SSDP_PORT)
-            self.transport.sendto(req.encode(), (SSDP_ADDR, SSDP_PORT))
-        except socket.error as msg:
-            self.__log.info("failure sending out the discovery message: %r", msg)
+            await self.update_interfaces()
+            self._search_seen.clear()
+            self.search_stats['searches'] += 1
+            for name, (address, _, transport) in self.interfaces.items():
+                self.__log.debug('send MSearch to %s:%d on %s', SSDP_ADDR, SSDP_PORT, name)
+                try:
+                    transport.sendto(req.encode(), (SSDP_ADDR, SSDP_PORT))
+                except socket.error as msg:
+                    self.__log.info("failure sending out the discovery message on %s: %r", name, msg)
         except Exception as msg:
             self.__log.exception("MSearch general failue")
 
     async def _resend_msearch(self):
         while True:
-            await self.MSearch()
-            await asyncio.sleep(120)
+            self._search_restart.clear()
+            self._search_started = self.loop.time()
+            for delay in itertools.chain(self.search_burst, itertools.repeat(self.search_interval)):
+                await self.MSearch()
+                try:
+                    await asyncio.wait_for(self._search_restart.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
@@ -106,6 +106,13 @@ class UPNPDevice:
     def events(self):
         return self.root.events
 
+    @property
+    def session(self):
+        return self.root.session
+
+    def latency(self, action):
+        return self.root.latency(action)
+
     @cached_property
     def localhost(self):
         return self.root._description.get('localhost')
@@ -115,8 +122,37 @@ class UPNPRootDevice(UPNPDevice):
     def __init__(self, description, ssdp, events):
         self._ssdp = ssdp
         self._events = events
+        self._session = None
+        self._latency = {}
         super().__init__(description=description)
 
+    async def shutdown(self):
+        await super().shutdown()
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        """keep-alive connections shared by all services and events of the device"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=2, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(sock_read=5),
+                raise_for_status=True)
+        return self._session
+
+    def latency(self, action):
+        if action not in self._latency:
+            self._latency[action] = dlna.LatencyHistogram()
+        return self._latency[action]
+
+    def stats(self):
+        return {action: histogram.status() for action, histogram in self._latency.items()}
+
     @property
     def root(self):
         return self
@@ -134,9 +170,13 @@ class UPNPServer(ssdp.SSDPServer):
     def __init__(self,
                  loop: Optional[asyncio.AbstractEventLoop] = None,
                  http: Optional[aiohttp.web.Application] = None,
-                 httpport: int = 0
+                 httpport: int = 0,
+                 device_types: Optional[tuple] = ('MediaRenderer',),
+                 describe_concurrency: int = 4,
+                 allowed_types: Optional[tuple] = ('upnp:rootdevice', 'urn:schemas-upnp-org:device:MediaRenderer:'),
+                 search_target: str = 'urn:schemas-upnp-org:device:MediaRenderer:1'
                  ) -> None:
-        super().__init__()
+        super().__init__(loop=loop, allowed_types=allowed_types, search_target=search_target)
 
         self.log = logging.getLogger('{}.{}'.format(__name__, __class__.__name__))
         self.loop = loop or asyncio.get_event_loop()
@@ -145,6 +185,13 @@ class UPNPServer(ssdp.SSDPServer):
         self.handler = None
         self.httpserver = None
         self.devices = {}
+        # root devices without any of these device types are not built, None accepts all
+        self.device_types = device_types
+        self._session = None
+        self._descriptions = {}
+        self._describing = {}
+        self._describe_limit = asyncio.Semaphore(describe_concurrency)
+        self.describe_stats = {'fetched': 0, 'revalidated': 0, 'skipped': 0, 'deduplicated': 0}
 
         self.events = events.EventsServer(loop=self.loop, http=self.http)
 
@@ -154,6 +201,7 @@ class UPNPServer(ssdp.SSDPServer):
             self.handler = self.http.make_handler()
             self.httpserver = self.loop.run_until_complete(self.loop.create_server(self.handler, '0.0.0.0', httpport))
             self.httpport = self.httpserver.sockets[0].getsockname()[1]
+            self.loop.run_until_complete(self.start())
 
     async def shutdown(self, app=None):
         #for device in self.devices.values():
@@ -161,6 +209,13 @@ class UPNPServer(ssdp.SSDPServer):
 
         await super().shutdown()
 
+        for device in self.devices.values():
+            await device.close()
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
         if self.httpserver:
             self.httpserver.close()
             await self.httpserver.wait_closed()
@@ -170,28 +225,95 @@ class UPNPServer(ssdp.SSDPServer):
             await self.handler.shutdown(60.0)
             await self.http.cleanup()
 
-    async def parse_description(self, url):
+    @property
+    def session(self):
+        """description fetching session, its connector records local address"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=TCPConnector(),
+                                                  timeout=aiohttp.ClientTimeout(sock_read=5),
+                                                  raise_for_status=True)
+        return self._session
+
+    def _accepted(self, data):
+        """check device types of whole device tree without building it"""
+        if self.device_types is None:
+            return True
+        for devicetype in xml.fromstring(data).iter('{*}deviceType'):
+            if UPNPDevice.getName((devicetype.text or '').strip()) in self.device_types:
+                return True
+        return False
+
+    async def _fetch_description(self, url):
+        """cached description of location url, revalidated with ETag/Last-Modified"""
+        cached = self._descriptions.get(url)
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last-modified']:
+                headers['If-Modified-Since'] = cached['last-modified']
+        async with self._describe_limit:
+            async with self.session.get(url, headers=headers) as resp:
+                localhost = resp._protocol.localhost[0]
+                if resp.status == 304 and cached is not None:
+                    self.describe_stats['revalidated'] += 1
+                    return cached, localhost
+                data = await resp.read()
+                self.describe_stats['fetched'] += 1
+                cached = self._descriptions[url] = {
+                    'etag': resp.headers.get('ETag'),
+                    'last-modified': resp.headers.get('Last-Modified'),
+                    'data': data,
+                    'accepted': self._accepted(data),
+                }
+                return cached, localhost
+
+    async def parse_description(self, url, interface=None):
+        """interface is (name, address) the device was seen on, its address is used for localhost"""
         try:
-            async with aiohttp.ClientSession(connector=TCPConnector(loop=self.loop), read_timeout=5, raise_for_status=True) as session:
-                async with session.get(url) as resp:
-                    data = await resp.read()
-                    spec = dlna.didl.fromString(data)
-                    device = spec.find('device')
-                    localhost = xml.SubElement(device, xml.QName(device.nsmap[None], 'localhost'))
-                    localhost.text = 'http://{}:{}/'.format(resp._protocol.localhost[0], self.httpport)
-                    return device
-        except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError) as err:
+            cached, localhost = await self._fetch_description(url)
+            if interface is not None:
+                localhost = interface[1]
+            if not cached['accepted']:
+                self.describe_stats['skipped'] += 1
+                self.log.debug('skip %s, no device of types %s', url, self.device_types)
+                return
+            spec = dlna.didl.fromString(cached['data'])
+            device = spec.find('device')
+            localhostelement = xml.SubElement(device, xml.QName(device.nsmap[None], 'localhost'))
+            localhostelement.text = 'http://{}:{}/'.format(localhost, self.httpport)
+            return device
+        except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError, xml.XMLSyntaxError) as err:
             self.log.warning('%s: %s', err.__class__.__name__, err)
             return
 
     async def device_created(self, device=None):
+        location = device.get('location')
+        if any(upnpdevice.location == location for upnpdevice in self.devices.values()):
+            # root device and its device type answer share one description
+            self.describe_stats['deduplicated'] += 1
+            return
+        task = self._describing.get(location)
+        if task is not None:
+            # same device announced again while its description is fetched
+            self.describe_stats['deduplicated'] += 1
+            return await asyncio.shield(task)
+        task = self._describing[location] = self.loop.create_task(self._device_created(device))
+        task.add_done_callback(lambda task: self._describing.pop(location, None))
+        return await asyncio.shield(task)
+
+    async def _device_created(self, device):
         self.log.warning('create %s', device)
-        description = await self.parse_description(device.get('location'))
-        if description is not None:
+        description = await self.parse_description(device.get('location'), device.interface)
+        if description is not None and device.get('usn') in self.ssdpdevices:
             self.devices[device.get('usn')] = UPNPRootDevice(description, device, self.events)
 
     async def device_removed(self, device=None):
         self.log.warning('remove %s', device)
+        location = device.get('location')
+        # cached description lives as long as some announced device uses it
+        if not any(ssdpdevice.get('location') == location for ssdpdevice in self.ssdpdevices.values()):
+            self._descriptions.pop(location, None)
         if device.get('usn') in self.devices:
             upnpdevice = self.devices.pop(device.get('usn'))
             notify.send('UPnP.RootDevice.removed', device=upnpdevice)
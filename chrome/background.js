@@ -2,6 +2,7 @@ var urllib = []
 var btlib = []
 var upnpstatus = null 
 var currenttabid = null 
+var searchtabs = {}
 var get = function(url, callback) {
     var xmlRequest = new XMLHttpRequest();
     xmlRequest.open('GET', url, true);
@@ -36,12 +37,15 @@ var CommonListener = function(tabid, url, title, details, callback) {
 }
 var ResolveListener = function(tabid, url, title, details, callback) {
     console.log("ResolveListener:", tabid, title, url, details);
+    searchtabs[url] = tabid;
     mrc.sendMessage({
         action: 'search',
         request: {
-            url: url
+            url: url,
+            stream: true
         }
     }, function(data) {
+        delete searchtabs[url];
         callback(tabid, data.response);
     });
 }
@@ -202,16 +206,26 @@ var UpdateProgress = function(data) {
         response: data
     });
 }
+var UpdatePartial = function(url, data) {
+    if (searchtabs[url] !== undefined) {
+        UpdateTabLib(searchtabs[url], data);
+    }
+}
 var UpdateTabLib = function(id, data) {
     urllib[id] = urllib[id] || []
     if (typeof(data) === 'object' && data) {
         console.log('UpdateTabLib', data);
+        let found = false;
         for (let i = 0; i < urllib[id].length; i++) {
             if (urllib[id][i].url === data.url) {
-                return null ;
+                // partial search result is completed in place
+                urllib[id][i] = data;
+                found = true;
             }
         }
-        urllib[id].push(data);
+        if (!found) {
+            urllib[id].push(data);
+        }
         // update popup if active:
         if (id == currenttabid) {
             chrome.extension.sendMessage({
@@ -267,12 +281,15 @@ var onHeadersReceived = function(callback, urlfilter) {
 //});
 function context_onclick(info, tab) {
     console.log('context_onclick', info, tab);
+    searchtabs[info.linkUrl] = tab.id;
     mrc.sendMessage({
         action: 'add',
         request: {
-            url: info.linkUrl
+            url: info.linkUrl,
+            stream: true
         }
     }, function(data) {
+        delete searchtabs[info.linkUrl];
         if (data.response !== 'done') {
             UpdateTabLib(tab.id, data.response);
         }
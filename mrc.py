@@ -11,9 +11,9 @@ import urllib.parse
 import os.path
 import sys
 import socket
+import time
 import logging
 import logging.handlers
-import mimetypes
 import multiprocessing
 import traceback
 import aiohttp
@@ -25,14 +25,24 @@ from typing import Optional
 from io import StringIO
 import contextlib
 
+youtube_dl = None
 have_youtube_dl = False
-try:
-    import youtube_dl
+
+
+def load_youtube_dl():
+    """import youtube_dl, slow, called from executor at startup"""
+    global youtube_dl, have_youtube_dl
+    if have_youtube_dl:
+        return True
+    try:
+        import youtube_dl as module
+    except ModuleNotFoundError:
+        return False
     # delete generic extractor
-    youtube_dl.extractor.gen_extractor_classes().remove(youtube_dl.extractor.generic.GenericIE)
+    module.extractor.gen_extractor_classes().remove(module.extractor.generic.GenericIE)
+    youtube_dl = module
     have_youtube_dl = True
-except ModuleNotFoundError:
-    pass
+    return True
 
 
 class MediaDevice:
@@ -90,22 +100,28 @@ class UPnPctrl:
         service.subscribe('CurrentTrackMetaData', self.state_variable_change)
         service.subscribe('TransportState', self.state_variable_change)
 
-    async def transporturi(self, url, title='Video', relative=False):
+    async def transporturi(self, url, title='Video', relative=False, meta=None):
+        """play url on current device, meta is torrentstream.FileMeta of local file"""
         if self.device:
             if relative:
                 self.log.debug('local: %s url: %s', self.device.media.localhost, url)
                 url = urllib.parse.urljoin(self.device.media.localhost, url)
             try:
-                async with aiohttp.ClientSession(timeout=aiohttp.client.ClientTimeout(connect=5)) as session:
-                    async with session.head(url) as response:
-                        ctype = response.headers.get('content-type', 'video/mp4')
-                        service = self.device.media.service('AVTransport')
-                        try:
-                            await service.stop()
-                        except aiohttp.client_exceptions.ClientError:
-                            pass
-                        await service.setavtransporturi(url, title, ctype)
-                        await service.play()
+                if meta is None:
+                    async with aiohttp.ClientSession(timeout=aiohttp.client.ClientTimeout(connect=5)) as session:
+                        async with session.head(url) as response:
+                            ctype = response.headers.get('content-type', 'video/mp4')
+                    protocolinfo = None
+                else:
+                    ctype = meta.mimetype
+                    protocolinfo = meta.protocolinfo
+                service = self.device.media.service('AVTransport')
+                try:
+                    await service.stop()
+                except aiohttp.client_exceptions.ClientError:
+                    pass
+                await service.setavtransporturi(url, title, ctype, protocolinfo)
+                await service.play()
             except (OSError, asyncio.TimeoutError, aiohttp.client_exceptions.ClientError) as err:
                 self.log.warning('transporturi %s', err)
                 return
@@ -179,27 +195,145 @@ class UPnPctrl:
                 self.log.error('trigger_callbacks exception %s', exeption)
 
     async def refresh(self):
-        await self.aioupnp.MSearch()
+        self.aioupnp.search()
+
+    def stats(self):
+        """ssdp registry, description fetching and per action latency of media renderers"""
+        return {
+            'ssdp': self.aioupnp.status(),
+            'describe': dict(self.aioupnp.describe_stats),
+            'renderers': {usn: {'device': device.media.friendlyName, 'actions': device.media.root.stats()}
+                          for usn, device in self.mediadevices.items()},
+        }
+
+    async def start(self):
+        await self.aioupnp.start()
+
+
+class Startup:
+    """background startup stages, readiness is reported to websocket clients"""
+    def __init__(self, loop):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.loop = loop
+        self.started = time.monotonic()
+        self.stages = {}
+        self.registered_callbacks = {}
+
+    def mark(self, name, begin, error=None):
+        """record stage finished now which begun at monotonic time begin"""
+        now = time.monotonic()
+        self.stages[name] = {
+            'ready': error is None,
+            'error': error,
+            'duration': round(now - begin, 3),
+            'elapsed': round(now - self.started, 3),
+        }
+        self.log.info('startup stage %s %s in %.3fs, %.3fs since start',
+                      name, 'ready' if error is None else 'failed', now - begin, now - self.started)
+        self.trigger_callbacks()
+
+    def stage(self, name, aw):
+        """run awaitable aw as named background stage"""
+        self.stages[name] = {'ready': False, 'error': None, 'duration': None, 'elapsed': None}
+
+        async def run():
+            begin = time.monotonic()
+            try:
+                await aw
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:
+                self.log.exception('startup stage %s', name)
+                self.mark(name, begin, str(exception))
+            else:
+                self.mark(name, begin)
+
+        return self.loop.create_task(run())
+
+    def status(self):
+        return {
+            'ready': all(stage['ready'] for stage in self.stages.values()),
+            'stages': {name: stage.copy() for name, stage in self.stages.items()},
+        }
+
+    def add_alert_handler(self, callback):
+        self.registered_callbacks[hash(callback)] = callback
+        self.loop.create_task(callback(self.status()))
+
+    def remove_alert_handler(self, callback):
+        self.registered_callbacks.pop(hash(callback), None)
+
+    def trigger_callbacks(self):
+        status = self.status()
+        for callback in self.registered_callbacks.values():
+            self.loop.create_task(callback(status))
 
 
 class CancellablePool:
-    def __init__(self, max_workers=3):
-        self._free = {self._new_pool() for _ in range(max_workers)}
+    _progress = None
+
+    def __init__(self, max_workers=3, max_jobs=None, initializer=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.initializer = initializer
+        self._free = set()
         self._working = set()
+        self._jobs = {}
+        self._pipes = {}
         self._change = asyncio.Event()
+        self.waiting = 0
+        self.stats = {'jobs': 0, 'cancelled': 0, 'recycled': 0, 'max_waiting': 0}
 
-    def _new_pool(self):
-        return multiprocessing.Pool(1)
+    @staticmethod
+    def _init_worker(progress, initializer):
+        CancellablePool._progress = progress
+        if initializer:
+            initializer()
 
-    async def apply(self, fn, *args):
+    @staticmethod
+    def progress(message):
+        """send partial result of running job to the parent, call from worker"""
+        if CancellablePool._progress is not None:
+            CancellablePool._progress.send(message)
+
+    def _new_pool(self):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        pool = multiprocessing.Pool(1, initializer=self._init_worker, initargs=(writer, self.initializer))
+        self._jobs[pool] = 0
+        self._pipes[pool] = (reader, writer)
+        return pool
+
+    def _retire(self, pool):
+        self._jobs.pop(pool, None)
+        pool.terminate()
+        for conn in self._pipes.pop(pool, ()):
+            conn.close()
+
+    def start(self):
+        """fork workers in advance, so first jobs find them warm"""
+        for _ in range(self.max_workers - len(self._free) - len(self._working)):
+            self._free.add(self._new_pool())
+
+    async def apply(self, fn, *args, progress=None):
         """
         Like multiprocessing.Pool.apply_async, but:
          * is an asyncio coroutine
          * terminates the process if cancelled
+         * recycles the process after max_jobs jobs
+         * calls progress with each message fn sends by CancellablePool.progress
         """
-        while not self._free:
-            await self._change.wait()
-            self._change.clear()
+        if not self._free and not self._working:
+            self.start()
+        self.waiting += 1
+        self.stats['max_waiting'] = max(self.stats['max_waiting'], self.waiting)
+        try:
+            while not self._free:
+                self.log.debug('apply waiting for worker, queue depth %d', self.waiting)
+                await self._change.wait()
+                self._change.clear()
+        finally:
+            self.waiting -= 1
         pool = usable_pool = self._free.pop()
         self._working.add(pool)
 
@@ -209,33 +343,87 @@ class CancellablePool:
             loop.call_soon_threadsafe(fut.set_result, obj)
         def _on_err(err):
             loop.call_soon_threadsafe(fut.set_exception, err)
+        reader = self._pipes[pool][0]
+        def _on_progress():
+            while reader.poll():
+                message = reader.recv()
+                if progress is not None:
+                    progress(message)
+        _on_progress()
+        fd = reader.fileno()
+        loop.add_reader(fd, _on_progress)
         pool.apply_async(fn, args, callback=_on_done, error_callback=_on_err)
+        self._jobs[pool] += 1
+        self.stats['jobs'] += 1
 
         try:
-            return await fut
+            result = await fut
+            # partial results are written before the job returns
+            _on_progress()
+            return result
         except asyncio.CancelledError:
-            pool.terminate()
+            self.stats['cancelled'] += 1
+            loop.remove_reader(fd)
+            self._retire(pool)
             usable_pool = self._new_pool()
         finally:
+            if usable_pool is pool:
+                loop.remove_reader(fd)
             self._working.remove(pool)
+            if usable_pool is pool and self.max_jobs and self._jobs[pool] >= self.max_jobs:
+                self.stats['recycled'] += 1
+                self._retire(pool)
+                usable_pool = self._new_pool()
             self._free.add(usable_pool)
             self._change.set()
 
+    def status(self):
+        return dict(self.stats,
+                    workers=len(self._free) + len(self._working),
+                    busy=len(self._working),
+                    waiting=self.waiting)
+
     def shutdown(self):
         for p in self._working | self._free:
-            p.terminate()
+            self._retire(p)
         self._free.clear()
 
 
 class Info:
-    def __init__(self, loop):
+    _ydl = None
+
+    def __init__(self, loop, pool=None, cache_ttl=300, cache_size=256, cache_file=None):
         self.log = logging.getLogger(self.__class__.__name__)
         self.loop = loop
+        self.pool = pool or CancellablePool(initializer=Info.warmup)
+        self.loaded = asyncio.Event()
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_file = cache_file
+        self._cache = {}
+        self._inflight = {}
+        self._listeners = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'extractions': 0,
+                      'latency_total': 0.0, 'latency_max': 0.0}
+
+    async def load(self):
+        """import youtube_dl off the loop, requests wait for it"""
+        try:
+            if self.cache_file:
+                self._cache = await self.loop.run_in_executor(None, self._read_cache, self.cache_file)
+            if await self.loop.run_in_executor(None, load_youtube_dl):
+                # workers are forked after import and inherit it
+                self.pool.start()
+            else:
+                self.log.warning('youtube_dl not available')
+        finally:
+            self.loaded.set()
 
     @staticmethod
-    def extract_info(url=None):
-        try:
-            ydl = youtube_dl.YoutubeDL(
+    def ydl():
+        """YoutubeDL instance kept for the lifetime of the worker process"""
+        if Info._ydl is None:
+            Info._ydl = youtube_dl.YoutubeDL(
                 params={
                     'quiet': True,
                     'cachedir': '/tmp/',
@@ -244,45 +432,183 @@ class Info:
                     'socket_timeout': 5,
                     'skip_download': True
                 })
-            stream = ydl.extract_info(url, False)
-            data = {}
-            data['src'] = stream.get('extractor')
-            data['title'] = stream.get('title')
-            data['url'] = stream.get('webpage_url')
-            data['bitrate'] = []
-            for i in stream.get('formats', []):
-                if i.get('acodec') != 'none' and i.get('vcodec') != 'none':
-                    data['bitrate'].append({'url':i.get('url'), 'bitrate':i.get('height') or i.get('format_id')})
-            return data
+        return Info._ydl
+
+    @staticmethod
+    def warmup():
+        """worker initializer, creates extractors before first job"""
+        try:
+            if load_youtube_dl():
+                Info.ydl()
+        except Exception:
+            pass
+
+    @staticmethod
+    def extract_info(url=None):
+        """
+        runs in worker, page metadata and each playable format are sent
+        by CancellablePool.progress before the complete result is returned
+        """
+        try:
+            ydl = Info.ydl()
+
+            def formats(stream, partial):
+                data = {
+                    'src': stream.get('extractor'),
+                    'title': stream.get('title'),
+                    'url': stream.get('webpage_url'),
+                    'bitrate': [],
+                }
+                if partial and data['title']:
+                    CancellablePool.progress(dict(data, bitrate=[]))
+                for i in stream.get('formats', []):
+                    if i.get('acodec') != 'none' and i.get('vcodec') != 'none':
+                        data['bitrate'].append({'url':i.get('url'), 'bitrate':i.get('height') or i.get('format_id')})
+                        if partial:
+                            CancellablePool.progress(dict(data, bitrate=list(data['bitrate'])))
+                return data
+
+            # unprocessed result already has title and raw formats, they are only sent as partial results
+            stream = ydl.extract_info(url, False, process=False)
+            formats(stream, True)
+            return formats(ydl.process_ie_result(stream, download=False), False)
         except Exception:
             pass
 
-    async def youtube_dl(self, url):
+    @staticmethod
+    def normalize(url):
+        """cache key, scheme and host are case insensitive, fragment is never sent"""
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+        return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, ''))
+
+    def _expires(self, data):
+        """cache expiry, signed media urls carry their own 'expire' timestamp"""
+        expires = time.time() + self.cache_ttl
+        for item in data.get('bitrate', []):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(item.get('url') or '').query)
+            try:
+                # keep a minute for the renderer to start playback
+                expires = min(expires, int(query['expire'][0]) - 60)
+            except (KeyError, ValueError):
+                pass
+        return expires
+
+    @staticmethod
+    def _read_cache(filename):
+        try:
+            with open(filename) as fd:
+                now = time.time()
+                return {key: (expires, data) for key, (expires, data) in json.load(fd).items() if expires > now}
+        except (OSError, ValueError, TypeError) as exception:
+            logging.getLogger(Info.__name__).info('youtube_dl cache not loaded %s', exception)
+            return {}
+
+    @staticmethod
+    def _write_cache(filename, cache):
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as fd:
+            json.dump(cache, fd)
+        os.replace(tmp, filename)
+
+    async def save(self):
+        if self.cache_file:
+            try:
+                await self.loop.run_in_executor(None, self._write_cache, self.cache_file, dict(self._cache))
+            except OSError as exception:
+                self.log.error('youtube_dl cache not saved %s', exception)
+
+    def _store(self, key, data):
+        expires = self._expires(data)
+        if expires <= time.time():
+            return
+        now = time.time()
+        self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+        while len(self._cache) >= self.cache_size:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = (expires, data)
+
+    def _progress(self, key, data):
+        for listener in self._listeners.get(key, ()):
+            listener(data)
+
+    async def _extract(self, key, url):
+        begin = time.monotonic()
+        try:
+            task = self.loop.create_task(self.pool.apply(self.extract_info, url,
+                                                        progress=lambda data: self._progress(key, data)))
+            data = await asyncio.wait_for(task, 60)
+            if data:
+                self._store(key, data)
+            return data
+        finally:
+            latency = time.monotonic() - begin
+            self.stats['extractions'] += 1
+            self.stats['latency_total'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+            self.log.info('youtube_dl %s extracted in %.3fs', url, latency)
+            self._inflight.pop(key, None)
+            self._listeners.pop(key, None)
+
+    async def youtube_dl(self, url, progress=None):
+        """progress is called with partial results while extraction runs"""
+        await self.loaded.wait()
         if not have_youtube_dl:
             return None
-        pool = CancellablePool()
-        task = self.loop.create_task(pool.apply(self.extract_info, url))
+        key = self.normalize(url)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.time():
+            self.stats['hits'] += 1
+            return cached[1]
+        self.stats['misses'] += 1
+        # identical concurrent requests share one extraction
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = self.loop.create_task(self._extract(key, url))
+        else:
+            self.stats['coalesced'] += 1
+        if progress is not None:
+            self._listeners.setdefault(key, []).append(progress)
         try:
-            return await asyncio.wait_for(task, 60)
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
         except Exception as exception:
             self.log.error('youtube_dl %s', exception)
         finally:
-            pool.shutdown()
+            if progress is not None and progress in self._listeners.get(key, ()):
+                self._listeners[key].remove(progress)
+
+    def status(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        extractions = self.stats['extractions']
+        return {
+            'pool': self.pool.status(),
+            'cache': dict(self.stats,
+                          entries=len(self._cache),
+                          hit_rate=self.stats['hits'] / lookups if lookups else None,
+                          latency_avg=self.stats['latency_total'] / extractions if extractions else None),
+        }
 
 
 class WebSocketFactory:
-    def __init__(self, loop=None, factory=None, upnp=None, torrent=None, peer=None, local=None, ws=None):
+    def __init__(self, loop=None, factory=None, upnp=None, torrent=None, startup=None, peer=None, local=None, ws=None,
+                 workers=3, worker_jobs=20, info_cache=None):
         self.log = logging.getLogger(self.__class__.__name__)
         self._factory = factory
         self._upnp = upnp
         self._torrent = torrent
+        self._startup = startup
         self._msg = None
         self.loop = loop
         self.peer = peer
         self.local = local
         self.ws = ws
         self.wsclients = set()
-        self.info = Info(self.factory.loop) if factory is None else None
+        self.info = Info(self.factory.loop,
+                         CancellablePool(max_workers=workers, max_jobs=worker_jobs, initializer=Info.warmup),
+                         cache_file=info_cache
+                         ) if factory is None else None
         super().__init__()
 
     @property
@@ -297,6 +623,10 @@ class WebSocketFactory:
     def torrent(self):
         return self.factory._torrent
 
+    @property
+    def startup(self):
+        return self.factory._startup
+
     async def websocket_handler(self, request):
         self.log.debug('websocket_handler %s %s', request.remote, request.host)
 
@@ -329,21 +659,15 @@ class WebSocketFactory:
     @staticmethod
     def videofiles(files):
         return files
-        ret = []
-        for i in files:
-            mime = mimetypes.guess_type(i['path'], strict=False)[0]
-            if mime and mime.startswith('video'):
-                ret.append(i)
-        return ret
 
     def btfileslist(self, infiles):
-        for handle in infiles:
-            for i in self.videofiles(handle['files']):
-                i['title'] = os.path.basename(i['path'])
-                i['url'] = urllib.parse.urljoin(
-                                self.torrent.options.get('urlpath'),
-                                urllib.parse.quote(i['path']))
-        return infiles
+        # infiles is torrent files list, entries are shared with its alert
+        return [dict(handle, files=[dict(i,
+                    title=os.path.basename(i['path']),
+                    url=urllib.parse.urljoin(
+                        self.torrent.options.get('urlpath'),
+                        urllib.parse.quote(i['path'])))
+                for i in self.videofiles(handle['files'])]) for handle in infiles]
 
     async def _btupdate(self, alert):
         await self.sendMessage(self.btfileslist(alert.files), {'action': 'btstatus'})
@@ -354,12 +678,22 @@ class WebSocketFactory:
     async def _progressupdate(self, alert):
         await self.sendMessage(alert.progress, {'action': 'progressupdate'})
 
+    def _partial(self, url):
+        """progress callback pushing partial results of url, request gets only the final reply"""
+        def progress(data):
+            self.factory.loop.create_task(self.sendMessage(data, {'action': 'searchpartial', 'url': url}))
+        return progress
+
+    async def _startupupdate(self, status):
+        await self.sendMessage(status, {'action': 'startup'})
+
     async def onOpen(self):
         self.log.info('WS client connected %s %s', self.peer, self.local)
         self.factory.wsclients.add(self)
         self.upnp.add_alert_handler(self._upnpupdate)
         self.torrent.add_alert_handler('files_list_update_alert', self._btupdate)
         self.torrent.add_alert_handler('progress_update_alert', self._progressupdate)
+        self.startup.add_alert_handler(self._startupupdate)
 
     def onClose(self):
         self.log.info('WS client closed %s %s', self.peer, self.local)
@@ -367,11 +701,14 @@ class WebSocketFactory:
         self.upnp.remove_alert_handler(self._upnpupdate)
         self.torrent.remove_alert_handler('files_list_update_alert', self._btupdate)
         self.torrent.remove_alert_handler('progress_update_alert', self._progressupdate)
+        self.startup.remove_alert_handler(self._startupupdate)
 
     async def onShutdown(self, app):
         for wsclient in set(self.wsclients):
             await wsclient.ws.close(code=aiohttp.WSCloseCode.GOING_AWAY,
                                     message='Server shutdown')
+        self.info.pool.shutdown()
+        await self.info.save()
 
     async def sendMessage(self, message, request: dict = None) -> None:
         if request is None:
@@ -391,7 +728,11 @@ class WebSocketFactory:
                     print("cookie", data.get('cookie'))
                     url = "http://{}:8080/?url={}&cookie={}".format(self.local, urllib.parse.quote(url), urllib.parse.quote(data.get('cookie')))
                 self.log.info('push to play relative %s, url: %s', data.get('relative'), url)
-                await self.upnp.transporturi(url, data.get('title', 'Video'), data.get('relative', False))
+                meta = None
+                urlpath = self.torrent.options.get('urlpath')
+                if data.get('relative') and url.startswith(urlpath):
+                    meta = await self.torrent.probe_file_meta(urllib.parse.unquote(url[len(urlpath):]))
+                await self.upnp.transporturi(url, data.get('title', 'Video'), data.get('relative', False), meta)
         elif action == 'play':
             await self.upnp.play()
         elif action == 'pause':
@@ -403,7 +744,7 @@ class WebSocketFactory:
         elif action == 'search':
             url = data.get('url')
             self.log.info('search %s', url)
-            ret = await self.factory.info.youtube_dl(url)
+            ret = await self.factory.info.youtube_dl(url, self._partial(url) if data.get('stream') else None)
             await self.sendMessage(ret)
         elif action == 'add':
             url = data.get('url')
@@ -422,7 +763,7 @@ class WebSocketFactory:
                 else:
                     await self.sendMessage(None)
 
-            ret = await self.factory.info.youtube_dl(url)
+            ret = await self.factory.info.youtube_dl(url, self._partial(url) if data.get('stream') else None)
             if ret:
                 await self.sendMessage(ret)
             else:
@@ -438,6 +779,12 @@ class WebSocketFactory:
         elif action == 'upnpstatus':
             message = self.upnp.device.status if self.upnp.device else None
             await self.sendMessage(message)
+        elif action == 'upnpstats':
+            await self.sendMessage(self.upnp.stats())
+        elif action == 'infostatus':
+            await self.sendMessage(self.factory.info.status())
+        elif action == 'startup':
+            await self.sendMessage(self.startup.status())
         elif action == 'recheck':
             info_hash = data.get('url')
             self.torrent.recheck(info_hash)
@@ -486,10 +833,13 @@ def main():
     # TODO: use argparse
     save_path = sys.argv[1] if len(sys.argv) > 1 else '/tmp/'
 
+    # http server is started first, slow parts run as background stages
+    startup = Startup(loop)
     http = aiohttp.web.Application(middlewares=[rootindex])
     upnp = UPnPctrl(loop=loop, http=http, httpport=httpport)
     torrent = torrentstream.TorrentStream(loop=loop, save_path=save_path, urlpath='/bt/')
-    ws = WebSocketFactory(loop=loop, upnp=upnp, torrent=torrent)
+    ws = WebSocketFactory(loop=loop, upnp=upnp, torrent=torrent, startup=startup,
+                          info_cache=os.path.join(save_path, 'youtube_dl.cache'))
     http.on_shutdown.append(ws.onShutdown)
 
     http.add_subapp(torrent.options['urlpath'], torrent.http)
@@ -506,6 +856,11 @@ def main():
     for sock in site._server.sockets:
         sock.setsockopt(socket.SOL_IP, socket.IP_TOS, 160)
 
+    startup.mark('http', startup.started)
+    startup.stage('torrent', torrent.restore_task)
+    startup.stage('ssdp', upnp.start())
+    startup.stage('youtube_dl', ws.info.load())
+
     class console(asyncio.Protocol):
         def __init__(self):
             super().__init__()
@@ -513,6 +868,7 @@ def main():
             self.torrent = torrent
             self.upnp = upnp
             self.ws = ws
+            self.startup = startup
 
         def connection_made(self, transport):
             self.transport = transport
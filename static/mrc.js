@@ -77,6 +77,8 @@ var mrc = new MRCServer(urlcfg, function(message) {
         UpdateUPNPStatus(message.response);
     } else if (message.action == 'progressupdate') {
         UpdateProgress(message.response);
+    } else if (message.action == 'searchpartial') {
+        UpdatePartial(message.url, message.response);
     }
 });
 
@@ -222,6 +224,7 @@ var addSingleLink = function(line, textcontent, url, title, cookie, localurl, id
 }
 var addLine = function(container, linkSource) {
     let line = document.createElement("div");
+    line.dataset.url = linkSource.url;
     let textcontent = linkSource.src + ': ' + linkSource.title || linkSource.url;
     addSingleLink(line, textcontent, linkSource.url, linkSource.title || linkSource.url, linkSource.cookie, null, null, 0);
     if (linkSource.bitrate !== undefined) {
@@ -229,6 +232,13 @@ var addLine = function(container, linkSource) {
             addSingleLink(line, linkSource.bitrate[i].bitrate || i + 1, linkSource.bitrate[i].url, linkSource.title || linkSource.url, linkSource.bitrate[i].cookie, null, null, 0);
         }
     }
+    // partial search results replace their earlier line
+    for (let i = 0; i < container.children.length; i++) {
+        if (container.children[i].dataset.url === linkSource.url) {
+            container.replaceChild(line, container.children[i]);
+            return;
+        }
+    }
     container.insertBefore(line, container.firstChild);
 }
 var addLinks = function(videoLinks) {
@@ -237,6 +247,12 @@ var addLinks = function(videoLinks) {
         addLine(container, videoLinks[i]);
     }
 }
+var UpdatePartial = function(url, data) {
+    let container = document.getElementById("content");
+    if (container) {
+        addLine(container, data);
+    }
+}
 var UpdateUPNPStatus = function(data) {
     let container = document.getElementById("upnp");
     container.textContent = '';
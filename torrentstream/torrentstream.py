@@ -10,101 +10,381 @@ import mimetypes
 import glob
 import os
 import asyncio
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import logging
 import binascii
+import base64
+import itertools
 import aiofiles
 from aiohttp import web
 import libtorrent
 import socket
 import json
+import struct
+import time
 
 FileInfo = namedtuple('FileInfo', ('id', 'handle', 'info'))
+Piece = namedtuple('Piece', ('piece', 'start'))
+FileMeta = namedtuple('FileMeta', ('mimetype', 'kind', 'profile', 'protocolinfo'))
+
+# extensions mimetypes module guesses wrong or does not know
+MIMETYPES = {
+    '.ts': 'video/mp2t',
+    '.m2ts': 'video/mp2t',
+    '.mkv': 'video/x-matroska',
+    '.mka': 'audio/x-matroska',
+}
+
+# streaming transfer mode for audio and video, interactive and background for images
+DLNA_FLAGS = 'DLNA.ORG_OP=01;DLNA.ORG_CI=0;DLNA.ORG_FLAGS=01700000000000000000000000000000'
+DLNA_IMAGE_FLAGS = 'DLNA.ORG_OP=01;DLNA.ORG_CI=0;DLNA.ORG_FLAGS=00d00000000000000000000000000000'
+
+# DLNA image profiles by maximal width and height
+JPEG_PROFILES = ((640, 480, 'JPEG_SM'), (1024, 768, 'JPEG_MED'), (4096, 4096, 'JPEG_LRG'))
+
+
+def protocol_info(mimetype, kind, profile=None):
+    """DLNA protocolInfo, profile only when confirmed by file content"""
+    flags = DLNA_IMAGE_FLAGS if kind == 'image' else DLNA_FLAGS
+    features = 'DLNA.ORG_PN={};{}'.format(profile, flags) if profile else flags
+    return 'http-get:*:{}:{}'.format(mimetype, features)
+
+
+def guess_file_meta(path):
+    """mimetype, media kind and DLNA protocolInfo of file, without profile"""
+    extension = os.path.splitext(path)[1].lower()
+    mimetype = MIMETYPES.get(extension) or mimetypes.guess_type(path, strict=False)[0] or 'application/octet-stream'
+    kind = mimetype.split('/')[0]
+    if kind not in ('video', 'audio', 'image'):
+        kind = 'other'
+    return FileMeta(mimetype=mimetype, kind=kind, profile=None, protocolinfo=protocol_info(mimetype, kind))
+
+
+def probe_profile(header):
+    """DLNA profile of baseline JPEG, PNG or MPEG-1 layer 3 file header, None if unknown"""
+    if header.startswith(b'\xff\xd8'):
+        pos = 2
+        while pos + 9 <= len(header) and header[pos] == 0xff:
+            marker = header[pos + 1]
+            if marker in (0xc0, 0xc1):
+                height, width = struct.unpack('>HH', header[pos + 5:pos + 9])
+                return next((profile for maxwidth, maxheight, profile in JPEG_PROFILES
+                             if width <= maxwidth and height <= maxheight), None)
+            if marker in (0xd9, 0xda) or 0xc2 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                return None
+            pos += 2 + struct.unpack('>H', header[pos + 2:pos + 4])[0]
+        return None
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', header[16:24])
+        return 'PNG_LRG' if width <= 4096 and height <= 4096 else None
+    pos = 0
+    if header.startswith(b'ID3') and len(header) >= 10:
+        size = header[6] << 21 | header[7] << 14 | header[8] << 7 | header[9]
+        pos = 10 + size + (10 if header[5] & 0x10 else 0)
+    frame = header[pos:pos + 4]
+    # MPEG-1 layer 3 frame sync, not free format, valid bitrate and sample rate
+    if len(frame) == 4 and frame[0] == 0xff and frame[1] & 0xfe == 0xfa and \
+            frame[2] >> 4 not in (0, 15) and frame[2] >> 2 & 3 != 3:
+        return 'MP3'
+    return None
+
+
+class RangeNotSatisfiable(Exception):
+    """none of Range header ranges overlaps file"""
+
+
+def parse_range(header, size):
+    """parse RFC 7233 byte ranges into [(start, stop)], None if header must be ignored"""
+    unit, _, specs = header.partition('=')
+    specs = specs.split(',')
+    if unit.strip().lower() != 'bytes' or len(specs) > 32:
+        return None
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.strip().partition('-')
+        if not sep or not (first or last):
+            return None
+        try:
+            if first:
+                start = int(first)
+                stop = int(last) + 1 if last else size
+                if last and stop <= start:
+                    return None
+            else:
+                # suffix range bytes=-N
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, stop = max(size - suffix, 0), size
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(stop, size)))
+    if not ranges:
+        raise RangeNotSatisfiable
+    return ranges
+
+
+class PieceCache:
+    """per torrent LRU cache of read_piece_alert buffers shared by producers"""
+    def __init__(self, stream, handle, maxsize):
+        self.log = logging.getLogger('{}.{}'.format('torrent', self.__class__.__name__))
+        self.stream = stream
+        self.handle = handle
+        self.info_hash = handle.info_hash().to_bytes()
+        self.key = str(handle.info_hash())
+        self.piecelength = handle.get_torrent_info().piece_length()
+        self.maxsize = maxsize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.pieces = OrderedDict()
+        self.pending = set()
+        self.missed = set()
+        self.stream.add_alert_handler('read_piece', self._read_piece_alert, handle)
+
+    def _read_piece_alert(self, alert):
+        self.log.debug("read_piece_alert %d %d", alert.piece, alert.size)
+        self.pending.discard(alert.piece)
+        self.missed.discard(alert.piece)
+        if alert.error.value() != 0:
+            self.log.warning("read_piece %d %s", alert.piece, alert.error.message())
+            return
+        if alert.piece in self.pieces:
+            return
+        self.pieces[alert.piece] = alert.buffer
+        self.size += len(alert.buffer)
+        if self.size > self.maxsize:
+            self._evict(alert.piece)
+
+    def _evict(self, keep):
+        """drop least recently used pieces, not those read cursors are about to write"""
+        protected = self.stream.cursor_pieces(self.key)
+        protected.add(keep)
+        for piece in [piece for piece in self.pieces if piece not in protected]:
+            if self.size <= self.maxsize:
+                break
+            self.size -= len(self.pieces.pop(piece))
+
+    def request(self, piece):
+        """issue read_piece unless piece already cached or in flight"""
+        if piece not in self.pieces and piece not in self.pending:
+            self.pending.add(piece)
+            self.handle.read_piece(piece)
+
+    def __contains__(self, piece):
+        return piece in self.pieces or piece in self.pending
+
+    @property
+    def usage(self):
+        """buffered plus outstanding read bytes"""
+        return self.size + len(self.pending) * self.piecelength
+
+    def get(self, piece):
+        """cached piece buffer or None"""
+        buffer = self.pieces.get(piece)
+        if buffer is None:
+            # producer polls until piece arrives, count it once
+            if piece not in self.missed:
+                self.missed.add(piece)
+                self.misses += 1
+        else:
+            self.hits += 1
+            self.pieces.move_to_end(piece)
+        return buffer
+
+    def shutdown(self):
+        # handle is already invalid after torrent removal
+        self.stream.remove_alert_handler('read_piece', self._read_piece_alert, info_hash=self.info_hash)
+        self.pieces.clear()
+        self.pending.clear()
+        self.missed.clear()
+        self.size = 0
+
+    def status(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'pieces': len(self.pieces),
+            'size': self.size,
+        }
 
 
 class DynamicTorrentProducer:
     """read data using read_piece + read_piece_alert"""
-    def __init__(self, stream, request, fileinfo, offset=0, size=None):
+    def __init__(self, stream, request, fileinfo, offset=0, size=None, peer=None):
         self.log = logging.getLogger('{}.{}'.format('torrent', self.__class__.__name__))
         self.stream = stream
         self.request = request
         self.fileinfo = fileinfo
+        self.peer = peer
         self.offset = offset
         self.size = size or fileinfo.info.size - offset
         self.lastoffset = self.offset + self.size - 1
         self.priority_window = None
         self.piece = None
-        self.buffer = {}
+        self.cache = None
+        self.prioritized = set()
+        self.abandoned = False
+        self.done = False
+        self.rate = 0
+        self.written = 0
+        self.ratetime = None
+        self.lastwrite = stream.loop.time()
         self.log.info("starting %s offset: %d size: %d", self.fileinfo.info.path, self.offset, self.size)
 
     def _read_piece_alert(self, alert):
-        self.log.debug("read_piece_alert %d %d", alert.piece, alert.size)
-        self.buffer[alert.piece] = alert.buffer
         self.request.resume()
 
     def _piece_finished_alert(self, alert):
+        self._update_window()
         self._slide()
         self.request.resume()
 
-    async def _read_piece(self):
-        self.log.debug("read_piece %d %d %d", self.piece.piece, self.piece.start, self.piece.start + self.lastoffset - self.offset)
-        buffer = self.buffer[self.piece.piece][self.piece.start:self.piece.start + self.lastoffset - self.offset]
+    async def _read_piece(self, buffer):
+        self.log.debug("read_piece %d %d %d", self.piece.piece, self.piece.start, self.piece.start + self.lastoffset - self.offset + 1)
+        buffer = buffer[self.piece.start:self.piece.start + self.lastoffset - self.offset + 1]
         await self.request.write(buffer)
         await self.request.drain()
-        self.offset += len(buffer)
-        del self.buffer[self.piece.piece]
-
-        if self.offset < self.lastoffset:
-            # move to next piece
-            self.piece = self.fileinfo.handle.get_torrent_info().map_file(self.fileinfo.id, self.offset, 0)
+        self._advance(len(buffer))
+
+    def _map_file(self, offset):
+        """map file offset to piece without libtorrent call"""
+        piece, start = divmod(self.fileinfo.info.offset + offset, self.piecelength)
+        return Piece(piece=piece, start=start)
+
+    def _advance(self, length):
+        """move cursor to next unread byte"""
+        self.offset += length
+        self.written += length
+        self.lastwrite = self.stream.loop.time()
+        if self.offset <= self.lastoffset:
+            self.piece = self._map_file(self.offset)
+            if self.abandoned:
+                # released as idle but client reads again
+                self.log.debug("resume abandoned %s at %d", self.fileinfo.info.path, self.offset)
+                self.abandoned = False
+                self.stream.resume_cursor(self)
+                self._slide(self.piece.piece)
         else:
+            self.done = True
             raise asyncio.CancelledError
 
     async def resumeProducing(self):
         """continue torrent download iteration"""
-        self.log.debug("index %d %s", self.piece.piece, self.buffer.keys())
-        for window in range(self.piece.piece, min(self.lastpiece.piece + 1, self.piece.piece + len(self.prioritymask))):
-            if not window in self.buffer and self.fileinfo.handle.have_piece(window):
-                self.buffer[window] = None
-                self.fileinfo.handle.read_piece(window)
-        if self.piece.piece in self.buffer and self.buffer[self.piece.piece]:
-            await self._read_piece()
+        self.log.debug("index %d", self.piece.piece)
+        # issue new reads only when client drains write buffer
+        if self.request.write_buffer_size() <= self.stream.options.get('write_low_water'):
+            readahead = 0
+            for window in range(self.piece.piece, min(self.lastpiece.piece + 1, self.piece.piece + len(self.prioritymask))):
+                if readahead >= self.stream.options.get('readahead_size'):
+                    break
+                if window in self.cache:
+                    readahead += self.piecelength
+                elif self.fileinfo.handle.have_piece(window):
+                    if window != self.piece.piece and \
+                            self.stream.piece_cache_usage() >= self.stream.options.get('readahead_total'):
+                        break
+                    self.cache.request(window)
+                    readahead += self.piecelength
+        buffer = self.cache.get(self.piece.piece)
+        if buffer:
+            await self._read_piece(buffer)
 
     async def stopProducing(self):
         """stop torrent download"""
         self.log.info("stopProducing %s size: %d", self.fileinfo.info.path, self.size)
-        self.stream.remove_alert_handler('read_piece', self._read_piece_alert, self.fileinfo.handle)
+        self.stream.release_cursor(self)
+        if self.cache is not None:
+            self.stream.remove_alert_handler('read_piece', self._read_piece_alert, self.fileinfo.handle)
         self.stream.remove_alert_handler('piece_finished', self._piece_finished_alert, self.fileinfo.handle)
 
-    async def start(self):
-        """start downloading torrent file"""
-        self.piece = self.fileinfo.handle.get_torrent_info().map_file(self.fileinfo.id, self.offset, 0)
-        self.lastpiece = self.fileinfo.handle.get_torrent_info().map_file(self.fileinfo.id, self.lastoffset, 0)
+    def _open_cache(self):
+        """pieces are read into shared torrent piece cache"""
+        self.cache = self.stream.piece_cache(self.fileinfo.handle)
+        self.stream.add_alert_handler('read_piece', self._read_piece_alert, self.fileinfo.handle)
+
+    async def start(self, ranges=()):
+        """start downloading torrent file, ranges are prioritized for next seek calls"""
         self.piecelength = self.fileinfo.handle.get_torrent_info().piece_length()
+        self.piece = self._map_file(self.offset)
+        self.lastpiece = self._map_file(self.lastoffset)
         self.log.debug("start %d %d %d %d", self.size, self.piece.piece, self.lastpiece.piece, self.piecelength)
 
         if self.piece.piece > self.lastpiece.piece:
+            self.done = True
             raise asyncio.CancelledError
 
-        self.stream.add_alert_handler('read_piece', self._read_piece_alert, self.fileinfo.handle)
+        self._open_cache()
+        self.stream.register_cursor(self)
         self.stream.add_alert_handler('piece_finished', self._piece_finished_alert, self.fileinfo.handle)
 
-        # priority window size 4Mb * 8
+        # priority window size 4Mb * 8 until client rate is measured
         priorityblock = int((4 * 1024 * 1024) / self.piecelength)
         # piece_length more than 4Mb ?
         if priorityblock < 1:
             priorityblock = 1
         elif priorityblock > 8:
             priorityblock = 8
-        self.prioritymask = [i for i in [TorrentStream.HIGHEST, TorrentStream.HIGHEST, 6, 5, 4, 3, 2, 1] for _ in range(priorityblock)]
-        self.log.debug("prioritymask %s", self.prioritymask)
+        self._set_prioritymask(priorityblock * 8)
+        self.ratetime = self.stream.loop.time()
 
         self.fileinfo.handle.resume()
         self._slide(self.piece.piece)
+        for num, (start, stop) in enumerate(ranges):
+            self.prioritized.update(self.stream.prioritize_range(self.fileinfo, start, stop, 3000 * (num + 2)))
+
+    async def seek(self, offset, size):
+        """continue with next range of the same file"""
+        self.offset = offset
+        self.size = size
+        self.lastoffset = self.offset + self.size - 1
+        self.piece = self._map_file(self.offset)
+        self.lastpiece = self._map_file(self.lastoffset)
+        self.done = False
+        self.log.debug("seek %d %d %d", self.size, self.piece.piece, self.lastpiece.piece)
+        self._slide(self.piece.piece)
+
+    def _set_prioritymask(self, depth):
+        levels = [TorrentStream.HIGHEST, TorrentStream.HIGHEST, 6, 5, 4, 3, 2, 1]
+        self.prioritymask = [levels[i * len(levels) // depth] for i in range(depth)]
+        self.log.debug("prioritymask %s", self.prioritymask)
+
+    def _update_window(self):
+        """size priority window in seconds of playback"""
+        now = self.stream.loop.time()
+        elapsed = now - self.ratetime
+        if elapsed < 1:
+            return
+        rate = self.written / elapsed
+        self.rate = rate if not self.rate else 0.7 * self.rate + 0.3 * rate
+        self.written = 0
+        self.ratetime = now
+        if not self.rate:
+            return
+
+        # do not prioritize more than torrent able to download in buffer time
+        download_rate = self.fileinfo.handle.status().download_rate
+        rate = min(self.rate, download_rate) if download_rate else self.rate
+        depth = int(rate * self.stream.options.get('buffer_seconds') / self.piecelength) + 1
+        depth = max(2, min(depth, self.stream.options.get('priority_window_max')))
+        if depth != len(self.prioritymask):
+            self.log.debug("rate %d download_rate %d depth %d", self.rate, download_rate, depth)
+            self._set_prioritymask(depth)
+
+    def _deadline(self, piece):
+        """milliseconds until client reaches piece"""
+        if not self.rate:
+            return 3000
+        ahead = (piece - self.piece.piece) * self.piecelength - self.piece.start
+        return max(self.stream.options.get('deadline_min'), int(ahead * 1000 / self.rate))
 
     def _slide(self, offset=None):
+        if self.abandoned:
+            return
         if offset is not None:
             self.priority_window = offset
+        self.prioritized = {piece for piece in self.prioritized if piece >= self.priority_window}
         window = self.priority_window
         data = []
         for priority in self.prioritymask:
@@ -118,7 +398,8 @@ class DynamicTorrentProducer:
                     window += 1
                 else:
                     data.append(window)
-                    self.fileinfo.handle.set_piece_deadline(window, 3000)
+                    self.prioritized.add(window)
+                    self.fileinfo.handle.set_piece_deadline(window, self._deadline(window))
                     self.fileinfo.handle.piece_priority(window, priority)
                     window += 1
                     break
@@ -139,47 +420,93 @@ class StaticTorrentProducer(DynamicTorrentProducer):
                 await self.request.drain()
             del data
 
-            if self.offset < self.lastoffset:
-                self.piece = self.fileinfo.handle.get_torrent_info().map_file(self.fileinfo.id, self.offset, 0)
+            if self.offset <= self.lastoffset:
+                self.piece = self._map_file(self.offset)
             else:
                 raise asyncio.CancelledError
 
     async def _read_piece(self):
-        """open file ones"""
+        """open file ones, read downloaded pieces run in batches"""
         # probably file exsists on filesystem because have_piece()==True success check
         # now we can open it
         if not hasattr(self, 'fileObject') or self.fileObject.closed:
             self.fileObject = await aiofiles.open(os.path.join(self.fileinfo.handle.save_path(), self.fileinfo.info.path), mode='rb')
             await self.fileObject.seek(self.offset)
 
-        if self.piece.piece < self.lastpiece.piece:
-            readlen = self.piecelength - self.piece.start
-        else:
-            readlen = self.lastpiece.start - self.piece.start + 1
+        readsize = self.stream.options.get('read_size')
+        lastpiece = self._available_run(self.piece.piece + (self.piece.start + readsize - 1) // self.piecelength)
+        readlen = min(self._run_length(lastpiece), readsize)
         data = await self.fileObject.read(readlen)
 
         if data:
-            self.offset += len(data)
             await self.request.write(data)
             await self.request.drain()
+        self._advance(len(data))
+
+    def _available_run(self, limit=None):
+        """last piece of downloaded pieces run starting from current piece"""
+        piece = self.piece.piece
+        limit = self.lastpiece.piece if limit is None else min(limit, self.lastpiece.piece)
+        while piece < limit and self.fileinfo.handle.have_piece(piece + 1):
+            piece += 1
+        return piece
+
+    def _run_length(self, lastpiece):
+        """bytes from cursor to the end of lastpiece"""
+        if lastpiece < self.lastpiece.piece:
+            return (lastpiece - self.piece.piece + 1) * self.piecelength - self.piece.start
+        return self.lastoffset - self.offset + 1
+
+    async def _sendfile(self):
+        """push downloaded pieces run from page cache directly to socket"""
+        if not hasattr(self, 'sendfileObject') or self.sendfileObject.closed:
+            self.sendfileObject = await self.stream.loop.run_in_executor(
+                None, open, os.path.join(self.fileinfo.handle.save_path(), self.fileinfo.info.path), 'rb')
+
+        lastpiece = self._available_run()
+        count = self._run_length(lastpiece)
+        self.log.debug("sendfile %d-%d offset: %d count: %d", self.piece.piece, lastpiece, self.offset, count)
 
-        if self.offset < self.lastoffset:
-            # move to next piece
-            self.piece = self.fileinfo.handle.get_torrent_info().map_file(self.fileinfo.id, self.offset, 0)
-        else:
-            raise asyncio.CancelledError
+        try:
+            await self.request.sendfile(self.sendfileObject, self.offset, count)
+        except NotImplementedError:
+            # ssl transport, event loop support is checked by TorrentStream
+            self.log.debug("sendfile not supported, fallback to read")
+            self.sendfile = False
+            return await self._read_piece()
+        self._advance(count)
+
+    def _open_cache(self):
+        """pieces are read from filesystem, no piece cache needed"""
+
+    async def start(self, ranges=()):
+        """start downloading torrent file"""
+        self.sendfile = self.stream.options.get('sendfile')
+        await super().start(ranges)
+
+    async def seek(self, offset, size):
+        """continue with next range of the same file"""
+        if hasattr(self, 'fileObject') and not self.fileObject.closed:
+            await self.fileObject.seek(offset)
+        await super().seek(offset, size)
 
     async def stopProducing(self):
         """stop torrent download"""
         if hasattr(self, 'fileObject') and not self.fileObject.closed:
             await self.fileObject.close()
+        if hasattr(self, 'sendfileObject') and not self.sendfileObject.closed:
+            self.sendfileObject.close()
         await super().stopProducing()
 
     async def resumeProducing(self):
         """continue torrent download iteration"""
         self.log.debug("index %d %d", self.size, self.piece.piece)
         if self.fileinfo.handle.have_piece(self.piece.piece):
-            await self._read_piece()
+            if self.sendfile:
+                await self._sendfile()
+            else:
+                # sendfile unavailable, pieces goes over userspace buffer
+                await self._read_piece()
 
 
 class TorrentProducer(StaticTorrentProducer):
@@ -187,6 +514,37 @@ class TorrentProducer(StaticTorrentProducer):
     pass
 
 
+class TorrentStreamResponse(web.StreamResponse):
+    """stream response waking up producer loop on every write"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.resume_event = asyncio.Event()
+
+    async def write(self, data):
+        self.resume()
+        transport = self._payload_writer.transport
+        if transport is not None and not transport.is_closing():
+            await super().write(data)
+
+    async def sendfile(self, fobj, offset, count):
+        self.resume()
+        transport = self._payload_writer.transport
+        if transport is None or transport.is_closing():
+            return
+        if transport.get_extra_info('sslcontext'):
+            raise NotImplementedError
+        await self._payload_writer.drain()
+        await asyncio.get_running_loop().sendfile(transport, fobj, offset, count)
+
+    def write_buffer_size(self):
+        transport = self._payload_writer.transport
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    def resume(self):
+        if not self.resume_event.is_set():
+            self.resume_event.set()
+
+
 class FilesListUpdateAlert:
     """custom libtorrent alert called from TorrentStream"""
     _what = 'files_list_update_alert'
@@ -226,10 +584,54 @@ class TorrentStream:
     def __init__(self, **options):
         self.log = logging.getLogger('{}.{}'.format('torrent', self.__class__.__name__))
         self._alert_handlers = {}
+        self._alert_stats = {}
+        self._progress_dirty = {}
+        self._progress_sent = {}
+        self._resume_dirty = {}
+        self._resume_pending = 0
+        self._resume_done = asyncio.Event()
+        self._resume_flushing = None
+        # fastresume files of removed torrents waiting for running batch write
+        self._resume_removing = set()
         self._files_list = {}
+        self._files_headers = {}
+        self._files_meta = {}
+        self._torrents = {}
+        self._files_version = 0
+        self._progress_version = 0
+        self._files_snapshot = (None, [])
+        self._files_json = (None, '[]')
+        self._files_epoch = int(time.time())
+        self._piece_cache = {}
+        self._cursors = {}
+        self._loaded = set()
+        self._prefetched = {}
+        # running container index walks, keyed like _prefetched
+        self._prefetching = {}
         self.options = options
         self.options.setdefault('save_path', '/tmp/')
+        self.options.setdefault('read_size', 8 * 1024 * 1024)
+        # piece cache holds read-ahead of 4 streams of readahead_size
+        self.options.setdefault('piece_cache_size', 128 * 1024 * 1024)
+        self.options.setdefault('readahead_size', 32 * 1024 * 1024)
+        self.options.setdefault('readahead_total', 128 * 1024 * 1024)
+        self.options.setdefault('write_low_water', 256 * 1024)
+        self.options.setdefault('buffer_seconds', 30)
+        self.options.setdefault('priority_window_max', 64)
+        self.options.setdefault('deadline_min', 500)
+        self.options.setdefault('prefetch_size', 4 * 1024 * 1024)
+        self.options.setdefault('cursor_idle', 10)
+        self.options.setdefault('progress_interval', 1)
+        self.options.setdefault('probe_size', 64 * 1024)
+        self.options.setdefault('resume_interval', 60)
+        # read-ahead budget must fit the cache holding it
+        self.options['readahead_total'] = min(self.options['readahead_total'], self.options['piece_cache_size'])
+        self.options['readahead_size'] = min(self.options['readahead_size'], self.options['readahead_total'])
         self.loop = options.get('loop', asyncio.get_event_loop())
+        # uvloop does not implement loop.sendfile, stream over read path there
+        self.options.setdefault('sendfile', type(self.loop).sendfile is not asyncio.AbstractEventLoop.sendfile)
+        if not self.options['sendfile']:
+            self.log.info("sendfile disabled, %s has no loop.sendfile", type(self.loop).__name__)
 
         self.http = web.Application()
         self.http.router.add_get('/{action:.*}', self.render_GET)
@@ -271,24 +673,29 @@ class TorrentStream:
 
         def metadata_received_alert(alert):
             self.log.info('got %d files', alert.handle.get_torrent_info().num_files())
-            #for i in range(alert.handle.get_torrent_info().num_files()):
-            #    info = alert.handle.get_torrent_info().file_at(i)
-            #    self._files_list[info.path] = FileInfo(id=i, handle=alert.handle, info=info)
+            self._index_add(alert.handle)
             self._handle_alert([FilesListUpdateAlert(self.list_files())])
 
         def torrent_added_alert(alert):
             if alert.handle.get_torrent_info():
                 metadata_received_alert(alert)
-
-        def tracker_announce_alert(alert):
-            self._handle_alert([FilesListUpdateAlert(self.list_files())])
+            elif alert.handle.is_valid():
+                self._index_add(alert.handle)
+                self._handle_alert([FilesListUpdateAlert(self.list_files())])
 
         def torrent_removed_alert(alert):
-            #info_hash = str(alert.handle.info_hash())
-            #for path, handle in dict(self._files_list).items():
-            #    if str(handle.handle.info_hash()) == info_hash:
-            #        del self._files_list[path]
-            self._handle_alert([FilesListUpdateAlert(self.list_files())])
+            cache = self._piece_cache.pop(str(alert.info_hash), None)
+            if cache:
+                cache.shutdown()
+            self._loaded.discard(str(alert.info_hash))
+            self._progress_dirty.pop(str(alert.info_hash), None)
+            self._progress_sent.pop(str(alert.info_hash), None)
+            self._prefetched = {key: pieces for key, pieces in self._prefetched.items() if key[0] != str(alert.info_hash)}
+            for key, task in list(self._prefetching.items()):
+                if key[0] == str(alert.info_hash):
+                    task.cancel()
+            if self._index_remove(str(alert.info_hash)):
+                self._handle_alert([FilesListUpdateAlert(self.list_files())])
 
         def torrent_error_alert(alert):
             self.session.remove_torrent(alert.handle)
@@ -302,98 +709,379 @@ class TorrentStream:
         def cache_flushed_alert(alert):
             self._save_resume_data(alert.handle)
 
-        async def save_resume_data(fn, fc):
-            try:
-                async with aiofiles.open(fn, mode='wb') as fd:
-                    await fd.write(fc)
-            except (IOError, EOFError) as e:
-                self.log.error("Unable to save fastresume %s", e)
-
         def save_resume_data_alert(alert):
+            if not alert.handle.is_valid():
+                # torrent removed after request, its file must not come back
+                self._resume_saved()
+                return
             self.log.info("save_resume_data_alert %s", alert.handle.get_torrent_info().name())
             fn = os.path.join(alert.handle.save_path(), alert.handle.get_torrent_info().name() + ".fastresume")
-            fc = libtorrent.write_resume_data_buf(alert.params)
-            self.loop.create_task(save_resume_data(fn, fc))
-
-        def piece_finished_alert(alert):
-            directory = {}
-            ti = alert.handle.get_torrent_info()
-            data = {}
-            progress = alert.handle.file_progress()
-            for num in range(ti.num_files()):
-                file = ti.file_at(num)
-                data[num] = progress[num] / file.size * 100.0
+            # written by _checkpoint in batch
+            self._resume_dirty[fn] = libtorrent.write_resume_data_buf(alert.params)
+            self._resume_saved()
 
-            data['progress'] = alert.handle.status().progress * 100.0
-            directory[str(alert.handle.info_hash())] = data
+        def save_resume_data_failed_alert(alert):
+            self._resume_saved()
 
-            self._handle_alert([ProgressUpdateAlert(directory)])
+        def piece_finished_alert(alert):
+            # progress is sent by _progress_updates on next tick
+            self._progress_dirty[str(alert.handle.info_hash())] = alert.handle
 
         self.add_alert_handler('torrent_added', torrent_added_alert)
         self.add_alert_handler('metadata_received', metadata_received_alert)
         self.add_alert_handler('torrent_checked', torrent_checked_alert)
         self.add_alert_handler('torrent_deleted', torrent_removed_alert)
+        self.add_alert_handler('torrent_removed', torrent_removed_alert)
         self.add_alert_handler('torrent_error', torrent_error_alert)
         #self.add_alert_handler('torrent_finished', torrent_finished_alert)
         self.add_alert_handler('file_completed', file_completed_alert)
         self.add_alert_handler('cache_flushed', cache_flushed_alert)
         self.add_alert_handler('save_resume_data', save_resume_data_alert)
-        self.add_alert_handler('tracker_announce', tracker_announce_alert)
+        self.add_alert_handler('save_resume_data_failed', save_resume_data_failed_alert)
         self.add_alert_handler('piece_finished', piece_finished_alert)
 
         self.rfile, self.wfile = socket.socketpair()
+        self.rfile.setblocking(False)
         self.loop.add_reader(self.rfile, self._handle_alert)
         self.session.set_alert_fd(self.wfile.fileno())
 
-        for file in glob.glob(self.options.get('save_path') + '/*.fastresume'):
+        self._progress_task = self.loop.create_task(self._progress_updates())
+        self._checkpoint_task = self.loop.create_task(self._checkpoint())
+        self.restore_task = self.loop.create_task(self.restore())
+
+    async def restore(self):
+        """add torrents from fastresume files read in parallel off the loop"""
+        def read(file):
+            with open(file, 'rb') as fd:
+                return fd.read()
+
+        files = await self.loop.run_in_executor(None, glob.glob, self.options.get('save_path') + '/*.fastresume')
+        results = await asyncio.gather(*(self.loop.run_in_executor(None, read, file) for file in files),
+                                       return_exceptions=True)
+        for file, resume_data in zip(files, results):
             try:
-                if os.path.exists(file):
-                    with open(file, 'rb') as fd:
-                        self.add_torrent(resume_data=fd.read())
+                if isinstance(resume_data, Exception):
+                    raise resume_data
+                self.add_torrent(resume_data=resume_data)
             except (IOError, EOFError, RuntimeError) as exception:
-                self.log.error("Unable to load fastresume %s", exception)
+                self.log.error("Unable to load fastresume %s %s", file, exception)
+        self.log.info("restored %d torrents", len(files))
+
+    def _write_resume_data(self, batch):
+        """write fastresume files atomically, return entries failed to write"""
+        failed = {}
+        for fn, fc in batch.items():
+            tmp = fn + '.tmp'
+            try:
+                with open(tmp, 'wb') as fd:
+                    fd.write(fc)
+                os.replace(tmp, fn)
+            except (IOError, EOFError) as e:
+                self.log.error("Unable to save fastresume %s %s", fn, e)
+                failed[fn] = fc
+        return failed
+
+    async def _flush_resume_data(self):
+        if not self._resume_dirty:
+            return
+        batch, self._resume_dirty = self._resume_dirty, {}
+        self._resume_flushing = self.loop.run_in_executor(None, self._write_resume_data, batch)
+        failed = await self._resume_flushing
+        # retry on next flush unless newer data arrived or torrent was removed meanwhile
+        for fn, fc in failed.items():
+            if fn not in self._resume_removing:
+                self._resume_dirty.setdefault(fn, fc)
+
+    async def _remove_resume_data(self, fn):
+        """remove fastresume file after batch write which may still recreate it"""
+        self._resume_removing.add(fn)
+        try:
+            if self._resume_flushing is not None:
+                await asyncio.wait([self._resume_flushing])
+            self._resume_dirty.pop(fn, None)
+            await self.loop.run_in_executor(None, os.remove, fn)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.log.error("Unable to remove fastresume %s %s", fn, e)
+        finally:
+            self._resume_removing.discard(fn)
+
+    async def _checkpoint(self):
+        """periodic resume data request and batch write"""
+        while True:
+            await asyncio.sleep(self.options.get('resume_interval'))
+            await self.save_all()
+
+    def _resume_saved(self):
+        self._resume_pending = max(0, self._resume_pending - 1)
+        if not self._resume_pending:
+            self._resume_done.set()
+
+    async def save_all(self, timeout=10):
+        """save resume data of all modified torrents, written after their alerts arrive"""
+        for handle in self.session.get_torrents():
+            self._save_resume_data(handle)
+        if self._resume_pending:
+            try:
+                await asyncio.wait_for(self._resume_done.wait(), timeout)
+            except asyncio.TimeoutError:
+                # lost alerts must not keep later rounds waiting
+                self.log.warning("%d resume data not saved", self._resume_pending)
+                self._resume_pending = 0
+                self._resume_done.set()
+        await self._flush_resume_data()
 
     def _handle_alert(self, alerts=None):
         if not alerts:
-            self.rfile.recv(1)
+            # drain all alert notifications at once
+            try:
+                while self.rfile.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
             alerts = self.session.pop_alerts()
 
+        debug = self.log.isEnabledFor(logging.DEBUG)
         for alert in alerts:
-            try:
-                self.log.debug('%s: %s', alert.what(), alert.message())
-            except:
-                self.log.debug('%s', alert.what())
+            what = alert.what()
+            if debug:
+                try:
+                    self.log.debug('%s: %s', what, alert.message())
+                except Exception:
+                    self.log.debug('%s', what)
 
+            handlers = self._alert_handlers.get(what, [])
             if hasattr(alert, 'handle'):
-                what = str(alert.handle.info_hash()) + ':' + alert.what()
-                if what in self._alert_handlers:
-                    for handler in self._alert_handlers[what]:
-                        if asyncio.iscoroutinefunction(handler):
-                            self.loop.create_task(handler(alert))
-                        else:
-                            handler(alert)
-            if alert.what() in self._alert_handlers:
-                for handler in self._alert_handlers[alert.what()]:
-                    if asyncio.iscoroutinefunction(handler):
-                        self.loop.create_task(handler(alert))
-                    else:
-                        handler(alert)
+                handlers = self._alert_handlers.get((self._info_hash(alert.handle), what), []) + handlers
+            if not handlers:
+                continue
+
+            start = time.perf_counter()
+            for handler in list(handlers):
+                if asyncio.iscoroutinefunction(handler):
+                    self.loop.create_task(handler(alert))
+                else:
+                    handler(alert)
+            elapsed = time.perf_counter() - start
+
+            stats = self._alert_stats.setdefault(what, {'count': 0, 'time': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['time'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+
+    def _progress(self, handle):
+        """files progress changed since last sent update"""
+        info_hash = str(handle.info_hash())
+        sent = self._progress_sent.setdefault(info_hash, {})
+        ti = handle.get_torrent_info()
+        data = {'progress': handle.status().progress * 100.0}
+        # fix SIGSEGV
+        progress = handle.file_progress() if data['progress'] else None
+        for num in range(ti.num_files()):
+            size = ti.file_at(num).size
+            if progress:
+                data[num] = progress[num] / size * 100.0 if size else 100.0
+            else:
+                data[num] = 0
+        delta = {key: value for key, value in data.items() if sent.get(key) != value}
+        sent.update(delta)
+        return delta
+
+    async def _progress_updates(self):
+        """send coalesced progress of torrents with finished pieces every tick"""
+        while True:
+            await asyncio.sleep(self.options.get('progress_interval'))
+            if not self._progress_dirty:
+                continue
+            dirty, self._progress_dirty = self._progress_dirty, {}
+            directory = {}
+            for info_hash, handle in dirty.items():
+                if handle.is_valid():
+                    delta = self._progress(handle)
+                    if delta:
+                        directory[info_hash] = delta
+                        self._progress_version += 1
+            if directory:
+                self._handle_alert([ProgressUpdateAlert(directory)])
+
+    @staticmethod
+    def _info_hash(handle):
+        """info_hash bytes of torrent handle, wrappers are new per alert so it is not cached"""
+        return handle.info_hash().to_bytes()
+
+    def alert_stats(self):
+        """per alert type handlers calls count and latency"""
+        return {what: {
+            'count': stats['count'],
+            'avg_ms': stats['time'] * 1000 / stats['count'],
+            'max_ms': stats['max'] * 1000,
+        } for what, stats in self._alert_stats.items()}
 
     def _save_resume_data(self, handle):
         if handle.is_valid() and handle.has_metadata() and handle.need_save_resume_data():
+            self._resume_pending += 1
+            self._resume_done.clear()
             handle.save_resume_data(libtorrent.save_resume_flags_t.save_info_dict | libtorrent.save_resume_flags_t.only_if_modified)
 
-    def add_alert_handler(self, alert, handler, handle=None):
+    def piece_cache(self, handle):
+        """shared piece cache of torrent handle"""
+        info_hash = str(handle.info_hash())
+        if info_hash not in self._piece_cache:
+            self._piece_cache[info_hash] = PieceCache(self, handle, self.options.get('piece_cache_size'))
+        return self._piece_cache[info_hash]
+
+    def register_cursor(self, producer):
+        """track producer read cursor, release cursors abandoned by client seek"""
+        info_hash = str(producer.fileinfo.handle.info_hash())
+        cursors = self._cursors.setdefault(info_hash, set())
+        siblings = [cursor for cursor in cursors
+                    if cursor.fileinfo.id == producer.fileinfo.id and cursor.peer == producer.peer]
+        cursors.add(producer)
+        if siblings:
+            # older connection may still be read, release it only when it stops writing
+            self._release_idle(producer)
+            self.loop.call_later(self.options.get('cursor_idle'), self._release_idle, producer)
+
+    def resume_cursor(self, producer):
+        """track released producer again"""
+        self._cursors.setdefault(str(producer.fileinfo.handle.info_hash()), set()).add(producer)
+
+    def _release_idle(self, producer):
+        """release cursors of producer client and file which did not write for cursor_idle seconds"""
+        info_hash = str(producer.fileinfo.handle.info_hash())
+        idle = self.loop.time() - self.options.get('cursor_idle')
+        for cursor in list(self._cursors.get(info_hash, ())):
+            if cursor is not producer and cursor.fileinfo.id == producer.fileinfo.id and \
+                    cursor.peer == producer.peer and cursor.lastwrite <= idle:
+                self.log.debug("seek %s from %d to %d", producer.fileinfo.info.path, cursor.offset, producer.offset)
+                self.release_cursor(cursor)
+
+    def cursor_pieces(self, info_hash):
+        """pieces of torrent within read-ahead of cached read cursors"""
+        pieces = set()
+        for cursor in self._cursors.get(info_hash, ()):
+            if cursor.cache is not None and cursor.piece is not None:
+                ahead = self.options.get('readahead_size') // cursor.piecelength + 1
+                pieces.update(range(cursor.piece.piece, min(cursor.lastpiece.piece + 1, cursor.piece.piece + ahead)))
+        return pieces
+
+    def release_cursor(self, producer):
+        """reset deadlines and priorities of pieces no other cursor waits for"""
+        producer.abandoned = True
+        info_hash = str(producer.fileinfo.handle.info_hash())
+        cursors = self._cursors.get(info_hash, set())
+        cursors.discard(producer)
+        if not cursors:
+            self._cursors.pop(info_hash, None)
+
+        handle = producer.fileinfo.handle
+        if not handle.is_valid():
+            return
+        priority = TorrentStream.LOW if info_hash in self._loaded else TorrentStream.PAUSE
+        pieces = producer.prioritized.difference(*(cursor.prioritized for cursor in cursors))
+        # keep container index prefetch
+        pieces.difference_update(*(prefetched for key, prefetched in self._prefetched.items() if key[0] == info_hash))
+        for piece in pieces:
+            if not handle.have_piece(piece):
+                handle.reset_piece_deadline(piece)
+                handle.piece_priority(piece, priority)
+        producer.prioritized.clear()
+        self.log.debug("released %s pieces %s", producer.fileinfo.info.path, sorted(pieces))
+
+    def prioritize_range(self, fileinfo, start, end, deadline):
+        """set highest priority on not downloaded pieces of file range"""
+        handle = fileinfo.handle
+        piecelength = handle.get_torrent_info().piece_length()
+        start = max(0, start)
+        end = min(end, fileinfo.info.size)
+        if start >= end:
+            return range(0)
+        pieces = range((fileinfo.info.offset + start) // piecelength, (fileinfo.info.offset + end - 1) // piecelength + 1)
+        for piece in pieces:
+            if not handle.have_piece(piece):
+                handle.piece_priority(piece, TorrentStream.HIGHEST)
+                handle.set_piece_deadline(piece, deadline)
+        return pieces
+
+    async def _read_range(self, fileinfo, offset, size):
+        """read file range waiting for its pieces download"""
+        handle = fileinfo.handle
+        pieces = self.prioritize_range(fileinfo, offset, offset + size, 0)
+        finished = asyncio.Event()
+
+        def piece_finished_alert(alert):
+            finished.set()
+
+        self.add_alert_handler('piece_finished', piece_finished_alert, handle)
+        try:
+            while not all(handle.have_piece(piece) for piece in pieces):
+                finished.clear()
+                await asyncio.wait_for(finished.wait(), 60)
+        finally:
+            self.remove_alert_handler('piece_finished', piece_finished_alert, handle)
+
+        async with aiofiles.open(os.path.join(handle.save_path(), fileinfo.info.path), mode='rb') as fileObject:
+            await fileObject.seek(offset)
+            return await fileObject.read(size)
+
+    async def _prefetch_mp4(self, fileinfo):
+        """walk mp4 top level boxes and prioritize moov box"""
+        filesize = fileinfo.info.size
+        offset = 0
+        try:
+            while offset + 8 <= filesize:
+                header = await self._read_range(fileinfo, offset, min(16, filesize - offset))
+                boxsize, boxtype = struct.unpack('>I4s', header[:8])
+                if boxsize == 1:
+                    boxsize, = struct.unpack('>Q', header[8:16])
+                elif boxsize == 0:
+                    boxsize = filesize - offset
+                if boxsize < 8:
+                    self.log.warning("prefetch %s broken box %s at %d", fileinfo.info.path, boxtype, offset)
+                    return
+                if boxtype == b'moov':
+                    self.log.info("prefetch %s moov at %d size %d", fileinfo.info.path, offset, boxsize)
+                    prefetched = self._prefetched.get((str(fileinfo.handle.info_hash()), fileinfo.id))
+                    if prefetched is not None:
+                        prefetched.update(self.prioritize_range(fileinfo, offset, offset + boxsize, 0))
+                    return
+                offset += boxsize
+        except (asyncio.TimeoutError, OSError, RuntimeError, struct.error) as exception:
+            # RuntimeError is raised by handle of removed torrent
+            self.log.warning("prefetch %s %s", fileinfo.info.path, exception.__class__.__name__)
+
+    def prefetch(self, fileinfo):
+        """prioritize file head and tail where containers keep their index"""
+        key = (str(fileinfo.handle.info_hash()), fileinfo.id)
+        if key in self._prefetched:
+            return
+        size = self.options.get('prefetch_size')
+        self._prefetched[key] = set(self.prioritize_range(fileinfo, 0, size, 1000))
+        self._prefetched[key].update(self.prioritize_range(fileinfo, fileinfo.info.size - size, fileinfo.info.size, 2000))
+        if os.path.splitext(fileinfo.info.path)[1].lower() in ('.mp4', '.m4v', '.mov'):
+            task = self._prefetching[key] = self.loop.create_task(self._prefetch_mp4(fileinfo))
+            task.add_done_callback(lambda task: self._prefetching.get(key) is task and self._prefetching.pop(key))
+
+    def piece_cache_usage(self):
+        """buffered plus outstanding read bytes of all torrents"""
+        return sum(cache.usage for cache in self._piece_cache.values())
+
+    def add_alert_handler(self, alert, handler, handle=None, info_hash=None):
         """register new callback on specific alert and optional on specific torrent handle"""
         if handle:
-            alert = str(handle.info_hash()) + ':' + alert
+            info_hash = self._info_hash(handle)
+        if info_hash:
+            alert = (info_hash, alert)
         if handler not in self._alert_handlers.setdefault(alert, []):
             self._alert_handlers[alert].append(handler)
 
-    def remove_alert_handler(self, alert, handler, handle=None):
+    def remove_alert_handler(self, alert, handler, handle=None, info_hash=None):
         """remove callback from alert"""
         if handle:
-            alert = str(handle.info_hash()) + ':' + alert
+            info_hash = self._info_hash(handle)
+        if info_hash:
+            alert = (info_hash, alert)
         if alert in self._alert_handlers and handler in self._alert_handlers[alert]:
             self._alert_handlers[alert].remove(handler)
             if not self._alert_handlers[alert]:
@@ -425,9 +1113,9 @@ class TorrentStream:
             if handle.is_valid():
                 ti = handle.get_torrent_info()
                 if ti:
-                    fastresume = handle.save_path() + "/" + ti.name() + '.fastresume'
-                    if os.path.exists(fastresume):
-                        os.remove(fastresume)
+                    fastresume = os.path.join(handle.save_path(), ti.name() + ".fastresume")
+                    self._resume_dirty.pop(fastresume, None)
+                    self.loop.create_task(self._remove_resume_data(fastresume))
                 self.session.remove_torrent(handle, libtorrent.options_t.delete_files)
                 return {'status': '{} removed'.format(info_hash)}
         except TypeError:
@@ -440,6 +1128,12 @@ class TorrentStream:
             handle = self.session.find_torrent(libtorrent.sha1_hash(binascii.unhexlify(info_hash)))
             if handle.is_valid():
                 handle.prioritize_pieces(handle.get_torrent_info().num_pieces() * [TorrentStream.LOW])
+                self._loaded.add(str(handle.info_hash()))
+                ti = handle.get_torrent_info()
+                for num in range(ti.num_files()):
+                    file = ti.file_at(num)
+                    if self.file_meta(file.path).kind == 'video':
+                        self.prefetch(FileInfo(id=num, handle=handle, info=file))
                 return {'status': '{} loading'.format(info_hash)}
         except TypeError:
             return {'error': '{} incorrect hash'.format(info_hash)}
@@ -470,36 +1164,112 @@ class TorrentStream:
         except TypeError:
             return {'error': 'incorrect hash'}
 
+    def _index_add(self, handle):
+        """add or refresh torrent files in files index"""
+        info_hash = str(handle.info_hash())
+        self._index_remove(info_hash)
+        data = {
+            'info_hash': info_hash,
+            'files': [],
+        }
+        ti = handle.get_torrent_info()
+        if ti:
+            data['title'] = ti.name()
+            for num in range(ti.num_files()):
+                file = ti.file_at(num)
+                meta = self._files_meta[file.path] = guess_file_meta(file.path)
+                data['files'].append({
+                    'path': file.path,
+                    'id': num,
+                    'mimetype': meta.mimetype,
+                    'kind': meta.kind,
+                })
+                self._files_list[file.path] = FileInfo(id=num, handle=handle, info=file)
+            data['files'].sort(key=lambda data: data['path'])
+            self._progress_sent.pop(info_hash, None)
+            self._progress(handle)
+        else:
+            data['title'] = info_hash
+        self._torrents[info_hash] = data
+        self._files_version += 1
+
+    def _index_remove(self, info_hash):
+        """remove torrent files from files index"""
+        data = self._torrents.pop(info_hash, None)
+        if data is None:
+            return False
+        for file in data['files']:
+            self._files_list.pop(file['path'], None)
+            self._files_headers.pop(file['path'], None)
+            self._files_meta.pop(file['path'], None)
+        self._files_version += 1
+        return True
+
+    def file_meta(self, path):
+        """cached mimetype, media kind and DLNA protocolInfo of file"""
+        meta = self._files_meta.get(path)
+        if meta is None:
+            meta = guess_file_meta(path)
+            if path in self._files_list:
+                self._files_meta[path] = meta
+        return meta
+
+    async def probe_file_meta(self, path):
+        """file meta with DLNA profile once file header is downloaded and recognized"""
+        meta = self.file_meta(path)
+        fileinfo = self._files_list.get(path)
+        if meta.profile or meta.kind not in ('audio', 'image') or fileinfo is None or not fileinfo.info.size:
+            return meta
+        try:
+            header = await self._read_probe(fileinfo, 0, min(fileinfo.info.size, self.options.get('probe_size')))
+        except OSError:
+            self.log.debug('probe of %s failed', path, exc_info=True)
+            return meta
+        profile = probe_profile(header) if header else None
+        if profile:
+            meta = self._files_meta[path] = meta._replace(profile=profile,
+                                                          protocolinfo=protocol_info(meta.mimetype, meta.kind, profile))
+            self._files_headers.pop(path, None)
+        return meta
+
+    def file_headers(self, path):
+        """cached response headers of file"""
+        headers = self._files_headers.get(path)
+        if headers is None:
+            fileinfo = self._files_list[path]
+            meta = self.file_meta(path)
+            headers = self._files_headers[path] = {
+                'accept-ranges': 'bytes',
+                'Content-Type': meta.mimetype,
+                'content-length': str(fileinfo.info.size),
+                'ETag': '"{}-{}"'.format(fileinfo.handle.info_hash(), fileinfo.id),
+                'Content-Disposition': 'inline; filename="{}"'.format(os.path.basename(path)),
+                'transferMode.dlna.org': 'Interactive' if meta.kind == 'image' else 'Streaming',
+                'contentFeatures.dlna.org': meta.protocolinfo.split(':', 3)[3],
+            }
+        return headers
+
+    def _files_index(self):
+        """torrents sorted by title, rebuilt only on index change"""
+        if self._files_snapshot[0] != self._files_version:
+            self._files_snapshot = (self._files_version, sorted(self._torrents.values(), key=lambda data: data['title']))
+        return self._files_snapshot[1]
+
     def list_files(self):
-        """list available files in torrents"""
+        """list available files in torrents with last sent progress"""
         directory = []
-        files_list = {}
-        for handle in self.session.get_torrents():
-            if handle.is_valid():
-                data = {
-                    'info_hash': str(handle.info_hash()),
-                    'files': [],
-                    'progress': handle.status().progress * 100.0,
-                }
-                ti = handle.get_torrent_info()
-                if ti:
-                    # fix SIGSEGV
-                    progress = handle.file_progress() if handle.status().progress else None
-                    data['title'] = ti.name()
-                    for num in range(ti.num_files()):
-                        file = ti.file_at(num)
-                        data['files'].append({
-                            'path':file.path,
-                            'id': num,
-                            'progress': progress[num]/file.size * 100.0 if progress else 0
-                        })
-                        files_list[file.path] = FileInfo(id=num, handle=handle, info=file)
-                    data['files'].sort(key=lambda data: data['path'])
-                else:
-                    data['title'] = str(handle.info_hash())
-                directory.append(data)
-        self._files_list = files_list
-        return sorted(directory, key=lambda data: data['title'])
+        for data in self._files_index():
+            progress = self._progress_sent.get(data['info_hash'], {})
+            directory.append(dict(data, progress=progress.get('progress', 0), files=[
+                dict(file, progress=progress.get(file['id'], 0)) for file in data['files']]))
+        return directory
+
+    def files_snapshot(self):
+        """files list json with its version, rebuilt on request after index or progress change"""
+        version = '{}.{}'.format(self._files_version, self._progress_version)
+        if self._files_json[0] != version:
+            self._files_json = (version, json.dumps(self.list_files()).encode('utf8').decode('unicode-escape'))
+        return self._files_json
 
     def recheck(self, info_hash):
         """recheck torrent"""
@@ -512,31 +1282,36 @@ class TorrentStream:
             return {'error': '{} incorrect hash'.format(info_hash)}
         return {'error': '{} not found'.format(info_hash)}
 
-    def status(self):
-        """dump torrent status"""
-        def space_break(string, length):
-            string = [str(i) for i in string]
-            return ' '.join(''.join(string[i:i+length]) for i in range(0, len(string), length))
+    def status(self, info_hash=None, offset=0, limit=None, pieces='bitfield'):
+        """dump torrent status
+
+        pieces: 'bitfield' - base64 have bitfield, 'rle' - [symbol, count] runs
+        of piece priority or '*' for downloaded piece, None - summary only
+        """
         status = {}
         status['version'] = libtorrent.version
+        status['alerts'] = self.alert_stats()
 
-        for handle in self.session.get_torrents():
-            info_hash = str(handle.info_hash())
+        handles = {str(handle.info_hash()): handle for handle in self.session.get_torrents()}
+        if info_hash is not None:
+            handles = {info_hash: handles[info_hash]} if info_hash in handles else {}
+        status['total'] = len(handles)
+        selected = sorted(handles)[offset:None if limit is None else offset + limit]
+
+        for info_hash in selected:
+            handle = handles[info_hash]
             s = {}
-            if handle.has_metadata():
-                torrent_info = handle.get_torrent_info()
-                piece_map = handle.get_piece_priorities()
-                for piece_index in range(torrent_info.num_pieces()):
-                    if handle.have_piece(piece_index):
-                        piece_map[piece_index] = '*'
-
-                s['pieces'] = space_break(piece_map, 100)
-                #file_map = ''
-                #for file_index in range(torrent_info.num_files()):
-                #    file_map += str(handle.file_priority(file_index))
-                #s['files'] = file_map
-                s['name'] = torrent_info.name()
             st = handle.status()
+            if handle.has_metadata():
+                if pieces == 'bitfield':
+                    bits = ''.join('1' if have else '0' for have in st.pieces)
+                    bits += '0' * (-len(bits) % 8)
+                    s['pieces'] = base64.b64encode(int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b'').decode()
+                elif pieces == 'rle':
+                    piece_map = ('*' if have else priority for have, priority in zip(st.pieces, handle.get_piece_priorities()))
+                    s['pieces'] = [[symbol, sum(1 for _ in run)] for symbol, run in itertools.groupby(piece_map)]
+                s['num_pieces'] = len(st.pieces)
+                s['name'] = st.name
             s['paused'] = st.paused
             s['state'] = st.state
             s['error'] = st.error
@@ -545,12 +1320,123 @@ class TorrentStream:
             s['upload_rate'] = st.upload_rate
             s['num_seeds'] = st.num_seeds
             s['num_peers'] = st.num_peers
+            if info_hash in self._piece_cache:
+                s['cache'] = self._piece_cache[info_hash].status()
             status[info_hash] = s
         return status
 
     async def shutdown(self, app):
+        for task in (self.restore_task, self._progress_task, self._checkpoint_task, *self._prefetching.values()):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.save_all()
         self.log.info("shutdown done")
 
+    async def _read_probe(self, fileinfo, start, stop):
+        """read small range from disk if all its pieces are downloaded"""
+        handle = fileinfo.handle
+        piecelength = handle.get_torrent_info().piece_length()
+        first = (fileinfo.info.offset + start) // piecelength
+        last = (fileinfo.info.offset + stop - 1) // piecelength
+        if not all(handle.have_piece(piece) for piece in range(first, last + 1)):
+            return None
+        async with aiofiles.open(os.path.join(handle.save_path(), fileinfo.info.path), mode='rb') as fileObject:
+            await fileObject.seek(start)
+            return await fileObject.read(stop - start)
+
+    async def render_file(self, request, path):
+        """stream torrent file content"""
+        fileForReading = self._files_list[path]
+        filesize = fileForReading.info.size
+        headers = self.file_headers(path)
+
+        # HEAD never touches producer machinery
+        if request.method == 'HEAD' and 'Range' not in request.headers:
+            return web.StreamResponse(headers=headers)
+
+        ranges = None
+        # ignore Range if If-Range validator is not current
+        if 'Range' in request.headers and request.headers.get('If-Range', headers['ETag']) == headers['ETag']:
+            try:
+                ranges = parse_range(request.headers['Range'], filesize)
+            except RangeNotSatisfiable:
+                headers = dict(headers)
+                del headers['content-length']
+                headers['content-range'] = 'bytes */{}'.format(filesize)
+                return web.Response(status=416, headers=headers)
+
+        preambles = []
+        epilogue = b''
+        if ranges is None:
+            status = 200
+            ranges = [(0, filesize)] if filesize else []
+        else:
+            status = 206
+            headers = dict(headers)
+            mimetype = headers['Content-Type']
+            if len(ranges) == 1:
+                headers['content-range'] = 'bytes {}-{}/{}'.format(ranges[0][0], ranges[0][1] - 1, filesize)
+                headers['content-length'] = str(ranges[0][1] - ranges[0][0])
+            else:
+                boundary = binascii.hexlify(os.urandom(16)).decode()
+                headers['Content-Type'] = 'multipart/byteranges; boundary={}'.format(boundary)
+                preambles = ['{}--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+                    '\r\n' if num else '', boundary, mimetype, start, stop - 1, filesize).encode()
+                    for num, (start, stop) in enumerate(ranges)]
+                epilogue = '\r\n--{}--\r\n'.format(boundary).encode()
+                headers['content-length'] = str(sum(len(preamble) for preamble in preambles) +
+                                                sum(stop - start for start, stop in ranges) + len(epilogue))
+
+        if request.method == 'HEAD':
+            return web.StreamResponse(status=status, headers=headers)
+
+        # renderer probe: small range, no prefetch and seek tracking
+        probe = sum(stop - start for start, stop in ranges) <= self.options.get('probe_size')
+        if probe and len(ranges) == 1:
+            data = await self._read_probe(fileForReading, *ranges[0])
+            if data is not None:
+                return web.Response(status=status, headers=headers, body=data)
+
+        resp = TorrentStreamResponse(status=status, headers=headers)
+        if not probe:
+            self.prefetch(fileForReading)
+        await resp.prepare(request)
+        if not ranges:
+            return resp
+
+        # one producer serves all ranges and prioritizes them together
+        producer = TorrentProducer(self, resp, fileForReading, ranges[0][0], ranges[0][1] - ranges[0][0],
+                                   peer=None if probe else request.remote)
+        try:
+            for num, (start, stop) in enumerate(ranges):
+                if preambles:
+                    await resp.write(preambles[num])
+                try:
+                    if num == 0:
+                        await producer.start(ranges[1:])
+                    else:
+                        await producer.seek(start, stop - start)
+                    while True:
+                        resp.resume_event.clear()
+                        await producer.resumeProducing()
+                        try:
+                            await asyncio.wait_for(resp.resume_event.wait(), 5)
+                        except asyncio.TimeoutError:
+                            pass
+                except asyncio.CancelledError:
+                    """raised by producer at the end of range or for stopProducing"""
+                    if not producer.done:
+                        raise
+            if epilogue:
+                await resp.write(epilogue)
+        finally:
+            await producer.stopProducing()
+
+        return resp
+
     async def render_GET(self, request):
         url = request.query.get('url', None)
         action = request.match_info.get('action')
@@ -565,6 +1451,8 @@ class TorrentStream:
                 '{p}add?url=http%3A%2F%2Fnewstudio.tv%2Fdownload.php%3Fid%3D17544'.format(p=prepath),
                 '{p}rm?url=3bebb88255c4e3a2080b514a47a41fe75cbd8a40'.format(p=prepath),
                 '{p}info'.format(p=prepath),
+                '{p}info?summary&offset=0&limit=10'.format(p=prepath),
+                '{p}info?hash=3bebb88255c4e3a2080b514a47a41fe75cbd8a40&pieces=rle'.format(p=prepath),
                 '{p}ls'.format(p=prepath),
                 '{p}file.avi'.format(p=prepath),
                 ]}
@@ -573,9 +1461,19 @@ class TorrentStream:
             self.add_torrent(url)
             ret = {'status': '{} added'.format(url)}
         elif action == 'info':
-            ret = self.status()
+            try:
+                offset = int(request.query.get('offset', 0))
+                limit = int(request.query['limit']) if 'limit' in request.query else None
+            except ValueError:
+                return web.json_response({'error': 'incorrect offset or limit'}, status=400)
+            pieces = None if 'summary' in request.query else request.query.get('pieces', 'bitfield')
+            ret = self.status(request.query.get('hash'), offset, limit, pieces)
         elif action == 'ls':
-            ret = self.list_files()
+            version, body = self.files_snapshot()
+            etag = '"{}-{}"'.format(self._files_epoch, version)
+            if etag in request.headers.get('If-None-Match', ''):
+                return web.Response(status=304, headers={'ETag': etag})
+            return web.Response(text=body, content_type='application/json', headers={'ETag': etag})
         elif action == 'rm' and url:
             ret = self.remove_torrent(url)
         elif action == 'pause' and url:
@@ -588,60 +1486,7 @@ class TorrentStream:
             if action not in self._files_list:
                 ret = help()
             else:
-                fileForReading = self._files_list[action]
-                mimetype = mimetypes.guess_type(action, strict=False)[0] or 'application/octet-stream'
-                filesize = fileForReading.info.size
-
-                ranges = request.http_range
-                offset = ranges.start or 0
-                stop = ranges.stop or filesize
-                rangestr = 'bytes {}-{}/{}'.format(offset, stop - 1, filesize)
-                size = stop - offset
-                status = 200 if ranges.start is None and ranges.stop is None else 206
-
-                resume = asyncio.Event()
-
-                class StreamResponse(web.StreamResponse):
-                    async def write(self, data):
-                        self.resume()
-                        if not self._payload_writer.transport.is_closing():
-                            await super().write(data)
-
-                    @staticmethod
-                    def resume():
-                        if not resume.is_set():
-                            resume.set()
-
-                resp = StreamResponse(status=status,
-                                      headers={
-                                          'accept-ranges': 'bytes',
-                                          'Content-Type': mimetype,
-                                          'content-length': str(size),
-                                          'content-range': rangestr,
-                                          'Content-Disposition': 'inline; filename="{}"'.format(os.path.basename(action))}
-                                     )
-
-                if request.method == 'HEAD':
-                    return resp
-
-                await resp.prepare(request)
-                producer = TorrentProducer(self, resp, fileForReading, offset, size)
-                try:
-                    await producer.start()
-                    while True:
-                        resume.clear()
-                        await producer.resumeProducing()
-                        try:
-                            await asyncio.wait_for(resume.wait(), 5)
-                        except asyncio.TimeoutError:
-                            pass
-                except asyncio.CancelledError:
-                    """raise for stopProducing"""
-                    raise
-                finally:
-                    await producer.stopProducing()
-
-                return resp
+                return await self.render_file(request, action)
 
         return web.json_response(ret, dumps=lambda a: json.dumps(a).encode('utf8').decode('unicode-escape'))
 